@@ -1,12 +1,109 @@
+import json
+
 from django.contrib import admin
+from django.contrib.admin.views.main import ALL_VAR, ORDER_VAR, PAGE_VAR, ChangeList
 from django.contrib.auth.admin import UserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 from .models import CustomUser
 
+# Параметр курсора keyset-пагинации в URL списка пользователей
+CURSOR_VAR = 'after'
+
+
+def estimated_count(queryset):
+    """
+    Возвращает оценку количества строк по статистике планировщика PostgreSQL.
+
+    Для запроса без фильтров берётся `pg_class.reltuples`, иначе — оценка `Plan Rows`
+    из EXPLAIN. Для других СУБД возвращает None.
+
+    :param queryset: Набор записей.
+    :type queryset: django.db.models.QuerySet
+    :return: Оценка количества строк или None.
+    :rtype: int or None
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    if not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        return row[0] if row and row[0] >= 0 else None
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор, который для больших таблиц использует оценку планировщика вместо COUNT(*).
+
+    Если оценка меньше `exact_count_threshold`, выполняется точный подсчёт — он дешёв.
+    """
+    exact_count_threshold = 100_000
+
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        if estimate is None or estimate < self.exact_count_threshold:
+            return super().count
+        return estimate
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Список изменений с keyset-пагинацией по `email` вместо OFFSET.
+
+    Следующая страница запрашивается как ``?after=<последний email>``, что даёт
+    ``WHERE email > %s ORDER BY email LIMIT n`` по уникальному (или частичному) индексу
+    независимо от глубины страницы. При сортировке по другой колонке, переходе по
+    номеру страницы или «Показать все» используется обычная пагинация Django.
+    """
+    keyset_field = 'email'
+
+    def get_filters_params(self, params=None):
+        params = super().get_filters_params(params)
+        params.pop(CURSOR_VAR, None)
+        return params
+
+    def get_results(self, request):
+        self.cursor = self.params.pop(CURSOR_VAR, None)
+        self.next_cursor = None
+        self.keyset_paging = not ({PAGE_VAR, ALL_VAR, ORDER_VAR} & set(request.GET))
+        if not self.keyset_paging:
+            return super().get_results(request)
+
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        queryset = self.queryset
+        if self.cursor:
+            queryset = queryset.filter(**{f'{self.keyset_field}__gt': self.cursor})
+        result_list = list(queryset[:self.list_per_page + 1])
+        if len(result_list) > self.list_per_page:
+            result_list = result_list[:self.list_per_page]
+            self.next_cursor = getattr(result_list[-1], self.keyset_field)
+
+        self.result_count = paginator.count
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = result_list
+        self.can_show_all = False
+        self.multi_page = bool(self.cursor or self.next_cursor)
+        self.paginator = paginator
+        self.first_page_url = self.get_query_string()
+        self.next_page_url = self.get_query_string({CURSOR_VAR: self.next_cursor}) if self.next_cursor else None
+
 
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
     model = CustomUser
     list_display = ['username', 'email', 'is_staff', 'is_active', 'get_id']
+    # Фильтры is_staff=True / is_active=False идут по частичным индексам (см. CustomUser.Meta)
     list_filter = ['is_staff', 'is_active']
     fieldsets = (
         (None, {'fields': ('username', 'email', 'password')}),
@@ -19,8 +116,14 @@ class CustomUserAdmin(UserAdmin):
             'fields': ('username', 'email', 'password1', 'password2', 'is_staff', 'is_active')}
          ),
     )
+    # На PostgreSQL icontains по этим полям использует триграммные индексы (миграция 0002)
     search_fields = ('email', 'username')
     ordering = ('email',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
 
     def get_id(self, obj):
         return str(obj.id)
@@ -29,4 +132,3 @@ class CustomUserAdmin(UserAdmin):
     def get_last_login(self, obj):
         return obj.last_login if obj.last_login else "Never logged in"
     get_last_login.short_description = 'Last Login'
-
@@ -0,0 +1,251 @@
+"""
+Ограничение числа одновременных запросов, хеширующих пароль (логин и регистрация).
+
+Это не throttling по клиенту, а защита сервиса: при всплеске легитимных логинов
+(например, после простоя, когда истекли все refresh-токены) хеширование не должно
+занять все потоки воркеров, иначе по таймауту начнут падать дешёвые эндпоинты
+(`/auth/profile/`, health checks).
+
+`AdmissionGate` пропускает не больше `ADMISSION_LIMIT` запросов на воркер
+(семафор), ещё до `ADMISSION_QUEUE_SIZE` запросов ждут свободного места не дольше
+`ADMISSION_WAIT_TIMEOUT` секунд, остальные сразу получают 503 с ``Retry-After``.
+Ожидающий запрос занимает поток воркера, поэтому очередь должна быть меньше,
+чем число потоков минус `ADMISSION_LIMIT`; значения по умолчанию выводятся из
+потоков gunicorn именно так (см. ``settings.py``), а ожидание покрывает несколько
+хешей, чтобы очередь не превращалась в 503 при обычной нагрузке.
+
+Если задан `ADMISSION_SHARED_LIMIT`, дополнительно действует общий для всех
+воркеров лимит: `SharedInFlightCounter` хранит число запросов каждого воркера в
+разделяемой памяти. Счётчик создаётся при импорте модуля, поэтому общим он будет
+только при ``preload_app`` (создаётся в мастере до fork). Слот завершившегося
+воркера освобождает мастер (хук ``child_exit`` в ``gunicorn.conf.py``), так что
+убитый по таймауту воркер не «съедает» лимит навсегда.
+"""
+import contextlib
+import ctypes
+import math
+import multiprocessing
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.http import JsonResponse
+
+
+class SharedInFlightCounter:
+    """
+    Счётчик запросов в работе, общий для процессов, созданных fork-ом после него.
+
+    Массив в разделяемой памяти состоит из пар ``(pid, count)``: каждый процесс
+    занимает свой слот, общая загрузка — сумма счётчиков. Проверка и увеличение
+    выполняются под одной межпроцессной блокировкой.
+    """
+    def __init__(self, limit, slots=64):
+        """
+        :param limit: Максимум запросов в работе во всех процессах.
+        :type limit: int
+        :param slots: Максимум одновременно живущих процессов.
+        :type slots: int
+        """
+        self.limit = limit
+        self.slots = slots
+        self._array = multiprocessing.Array(ctypes.c_long, slots * 2)
+        self._slot_pid = None
+        self._slot = None
+
+    def _own_slot(self):
+        """
+        Возвращает индекс слота текущего процесса, при необходимости занимая свободный.
+        Вызывается под блокировкой массива.
+        """
+        pid = os.getpid()
+        if self._slot_pid == pid:
+            return self._slot
+        values = self._array.get_obj()
+        free = None
+        for index in range(self.slots):
+            if values[index * 2] == pid:
+                free = index
+                break
+            if free is None and values[index * 2] == 0:
+                free = index
+        if free is not None:
+            values[free * 2] = pid
+            values[free * 2 + 1] = 0
+        self._slot_pid, self._slot = pid, free
+        return free
+
+    def in_flight(self):
+        """
+        :return: Сумма запросов в работе во всех процессах.
+        :rtype: int
+        """
+        with self._array.get_lock():
+            values = self._array.get_obj()
+            return sum(values[index * 2 + 1] for index in range(self.slots))
+
+    def try_acquire(self):
+        """
+        Занимает место, если общий лимит не исчерпан.
+
+        :return: True, если место занято. Если свободных слотов для процесса нет,
+            запрос пропускается без учёта.
+        :rtype: bool
+        """
+        with self._array.get_lock():
+            slot = self._own_slot()
+            if slot is None:
+                return True
+            values = self._array.get_obj()
+            if sum(values[index * 2 + 1] for index in range(self.slots)) >= self.limit:
+                return False
+            values[slot * 2 + 1] += 1
+            return True
+
+    def release(self):
+        with self._array.get_lock():
+            slot = self._own_slot()
+            if slot is not None:
+                values = self._array.get_obj()
+                values[slot * 2 + 1] = max(0, values[slot * 2 + 1] - 1)
+
+    def release_process(self, pid):
+        """
+        Освобождает слот завершившегося процесса вместе с его счётчиком.
+
+        :param pid: Pid процесса.
+        :type pid: int
+        """
+        with self._array.get_lock():
+            values = self._array.get_obj()
+            for index in range(self.slots):
+                if values[index * 2] == pid:
+                    values[index * 2] = values[index * 2 + 1] = 0
+
+
+class AdmissionGate:
+    """
+    Семафор на воркер с ограниченной очередью ожидания и необязательным общим лимитом.
+    """
+    def __init__(self, limit, queue_size=0, wait_timeout=0.0, shared=None):
+        """
+        :param limit: Максимум запросов в работе в процессе.
+        :type limit: int
+        :param queue_size: Максимум запросов, ожидающих места.
+        :type queue_size: int
+        :param wait_timeout: Максимальное ожидание места, в секундах.
+        :type wait_timeout: float
+        :param shared: Общий для процессов счётчик или None.
+        :type shared: SharedInFlightCounter or None
+        """
+        self.limit = limit
+        self.queue_size = queue_size
+        self.wait_timeout = wait_timeout
+        self.shared = shared
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.rejected = 0
+
+    def _reject(self):
+        with self._lock:
+            self.rejected += 1
+        return False
+
+    def acquire(self):
+        """
+        Занимает место, при необходимости ожидая в очереди.
+
+        :return: True, если запрос допущен; False — если его нужно отклонить.
+        :rtype: bool
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        if not self._semaphore.acquire(blocking=False):
+            with self._lock:
+                if self.waiting >= self.queue_size:
+                    self.rejected += 1
+                    return False
+                self.waiting += 1
+            try:
+                acquired = self._semaphore.acquire(timeout=self.wait_timeout) if self.wait_timeout > 0 else False
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+            if not acquired:
+                return self._reject()
+        if self.shared is None:
+            return True
+        # Общий лимит опрашивается до истечения того же срока ожидания
+        while not self.shared.try_acquire():
+            if time.monotonic() >= deadline:
+                self._semaphore.release()
+                return self._reject()
+            time.sleep(0.005)
+        return True
+
+    def release(self):
+        if self.shared is not None:
+            self.shared.release()
+        self._semaphore.release()
+
+    @contextlib.contextmanager
+    def admit(self):
+        """
+        Контекстный менеджер: выдаёт True, если запрос допущен, и освобождает место на выходе.
+        """
+        admitted = self.acquire()
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                self.release()
+
+
+def _build_gate():
+    shared_limit = getattr(settings, 'ADMISSION_SHARED_LIMIT', 0)
+    return AdmissionGate(
+        limit=getattr(settings, 'ADMISSION_LIMIT', 1),
+        queue_size=getattr(settings, 'ADMISSION_QUEUE_SIZE', 2),
+        wait_timeout=getattr(settings, 'ADMISSION_WAIT_TIMEOUT', 2.0),
+        shared=SharedInFlightCounter(shared_limit) if shared_limit else None,
+    )
+
+
+# Создаётся при импорте: при preload_app — в мастере, до fork воркеров
+hashing_gate = _build_gate()
+
+
+def release_worker(pid):
+    """
+    Освобождает долю общего лимита завершившегося воркера (вызывается в мастере).
+
+    :param pid: Pid воркера.
+    :type pid: int
+    """
+    if hashing_gate.shared is not None:
+        hashing_gate.shared.release_process(pid)
+
+
+def overloaded_response():
+    """
+    Ответ 503 с ``Retry-After`` для отклонённого запроса.
+
+    :rtype: django.http.JsonResponse
+    """
+    response = JsonResponse({'detail': 'Service is busy, please retry later.'}, status=503)
+    response['Retry-After'] = str(math.ceil(getattr(settings, 'ADMISSION_RETRY_AFTER', 1)))
+    return response
+
+
+class AdmissionControlMixin:
+    """
+    Примесь к представлениям, хеширующим пароль: POST-запросы проходят через `hashing_gate`.
+    """
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != 'POST':
+            return super().dispatch(request, *args, **kwargs)
+        with hashing_gate.admit() as admitted:
+            if not admitted:
+                return overloaded_response()
+            return super().dispatch(request, *args, **kwargs)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class AuthConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'custom_auth'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        # Проект не является приложением: его проверки регистрируются здесь
+        from sr_auth_api import checks  # noqa: F401
@@ -0,0 +1,250 @@
+"""
+Проверка, свободны ли имя пользователя и почта, для формы регистрации.
+
+Форма проверяет значения на каждое нажатие клавиши, и почти всегда они свободны.
+Поэтому в каждом воркере хранится фильтр Блума нормализованных имён и адресов
+(`AvailabilityIndex`): если значения в фильтре нет, оно точно свободно, и ответ
+даётся без БД. Только при возможном совпадении выполняется точный запрос по
+уникальным индексам `username`/`email`.
+
+Фильтр загружается при старте воркера (шаг прогрева ``availability``) одним
+потоковым проходом по таблице пользователей, пополняется при сохранении
+пользователя (сигнал ``post_save`` — регистрация, смена почты в профиле, админка) и
+раз в `AVAILABILITY_REBUILD_INTERVAL` секунд перестраивается в фоновом потоке:
+удалять значения фильтр Блума не умеет, а пользователи, созданные в других
+воркерах, попадают в него только при перестройке. Если прогрев выключен, фильтр
+загружается при первой проверке. Ответ носит справочный характер — уникальность
+всё равно проверяет регистрация.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+import unicodedata
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from .models import CustomUser
+
+logger = logging.getLogger(__name__)
+
+USERNAME = 'username'
+EMAIL = 'email'
+
+
+class BloomFilter:
+    """
+    Фильтр Блума на `bytearray` с двойным хешированием blake2b.
+
+    Запись не потокобезопасна (установка бита — чтение и запись байта), её
+    синхронизирует `AvailabilityIndex`; чтение безопасно, биты только добавляются.
+    """
+    def __init__(self, capacity, error_rate=0.01):
+        """
+        :param capacity: Ожидаемое число значений.
+        :type capacity: int
+        :param error_rate: Допустимая доля ложноположительных ответов при `capacity` значениях.
+        :type error_rate: float
+        """
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + index * second) % self.size for index in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+def normalize_email(value):
+    """
+    Почта в том виде, в каком её сохранит регистрация (домен в нижнем регистре).
+
+    :param value: Введённая почта.
+    :type value: str
+    :rtype: str
+    """
+    return CustomUser.objects.normalize_email(value)
+
+
+def filter_key(kind, value):
+    """
+    Ключ значения в фильтре. Ключ строится без учёта регистра: значения,
+    отличающиеся регистром, дают «возможное совпадение», а окончательный ответ
+    даёт точный запрос с теми же правилами, что и уникальные индексы.
+
+    :param kind: `USERNAME` или `EMAIL`.
+    :type kind: str
+    :param value: Нормализованное значение.
+    :type value: str
+    :rtype: str
+    """
+    return f'{kind}:{unicodedata.normalize("NFKC", value).casefold()}'
+
+
+class AvailabilityIndex:
+    """
+    Фильтр Блума имён и адресов пользователей одного воркера.
+
+    При перестройке новый фильтр собирается рядом со старым; значения, добавленные
+    за это время, записываются в оба, затем фильтры атомарно меняются местами.
+    """
+    def __init__(self):
+        self._filter = None
+        self._building = None
+        self._built_at = 0.0
+        self._rebuilding = False
+        self._lock = threading.Lock()
+        # Загрузки не выполняются параллельно: первая проверка ждёт уже начатую
+        self._load_lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._filter is not None
+
+    def load(self):
+        """
+        Строит фильтр по всем пользователям одним потоковым проходом.
+
+        :return: Количество загруженных пользователей.
+        :rtype: int
+        """
+        with self._load_lock:
+            return self._load()
+
+    def _load(self):
+        started = time.perf_counter()
+        with self._lock:
+            self._building = []
+        try:
+            total = CustomUser.objects.count()
+            # Запас на регистрации до следующей перестройки
+            capacity = max(getattr(settings, 'AVAILABILITY_FILTER_CAPACITY', 100000), total * 4)
+            bloom = BloomFilter(capacity, getattr(settings, 'AVAILABILITY_FILTER_ERROR_RATE', 0.01))
+            users = 0
+            rows = CustomUser.objects.values_list('username', 'email').order_by()
+            for username, email in rows.iterator(chunk_size=5000):
+                bloom.add(filter_key(USERNAME, username))
+                bloom.add(filter_key(EMAIL, email))
+                users += 1
+            with self._lock:
+                for key in self._building:
+                    bloom.add(key)
+                self._filter = bloom
+                self._built_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._building = None
+        duration_ms = round((time.perf_counter() - started) * 1000, 3)
+        logger.info('Availability filter loaded: %s users in %.1fms', users, duration_ms,
+                    extra={'users': users, 'bits': bloom.size, 'hashes': bloom.hashes, 'duration_ms': duration_ms})
+        return users
+
+    def add_user(self, username, email):
+        """
+        Добавляет имя и почту сохранённого пользователя. До загрузки фильтра ничего
+        не делает: загрузка прочитает пользователя из БД.
+
+        :param username: Имя пользователя.
+        :type username: str
+        :param email: Почта.
+        :type email: str
+        """
+        keys = [filter_key(USERNAME, username), filter_key(EMAIL, email)]
+        with self._lock:
+            if self._filter is not None:
+                for key in keys:
+                    self._filter.add(key)
+            if self._building is not None:
+                self._building.extend(keys)
+
+    def might_contain(self, kind, value):
+        """
+        :return: False, если значение точно не встречается у пользователей.
+        :rtype: bool
+        """
+        if self._filter is None:
+            with self._load_lock:
+                if self._filter is None:
+                    self._load()
+        else:
+            self._maybe_rebuild()
+        return filter_key(kind, value) in self._filter
+
+    def _maybe_rebuild(self):
+        bloom = self._filter
+        stale = time.monotonic() - self._built_at >= getattr(settings, 'AVAILABILITY_REBUILD_INTERVAL', 600)
+        if not stale and bloom.count <= bloom.capacity:
+            return
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild, name='availability-rebuild', daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            self.load()
+        except Exception:
+            logger.exception('Availability filter rebuild failed')
+            # Следующая попытка — через интервал перестройки, старый фильтр продолжает работать
+            self._built_at = time.monotonic()
+        finally:
+            # Соединение потока не закрывается само по окончании запроса
+            connection.close()
+            with self._lock:
+                self._rebuilding = False
+
+
+index = AvailabilityIndex()
+
+
+def check_availability(username=None, email=None):
+    """
+    Проверяет, свободны ли имя пользователя и почта.
+
+    Значения, которых точно нет в фильтре, свободны без обращения к БД; возможные
+    совпадения проверяются одним запросом по уникальным индексам.
+
+    :param username: Имя пользователя или None.
+    :type username: str or None
+    :param email: Почта или None.
+    :type email: str or None
+    :return: ``{'username': bool, 'email': bool}`` только для переданных значений; True — свободно.
+    :rtype: dict
+    """
+    # Как при регистрации: поля сериализатора обрезают пробелы, имя сохраняется
+    # без изменений, у почты домен приводится к нижнему регистру
+    values = {}
+    if username is not None:
+        values[USERNAME] = username.strip()
+    if email is not None:
+        values[EMAIL] = normalize_email(email.strip())
+
+    result = {kind: True for kind in values}
+    candidates = {kind: value for kind, value in values.items() if index.might_contain(kind, value)}
+    if candidates:
+        query = Q()
+        for kind, value in candidates.items():
+            query |= Q(**{kind: value})
+        for found_username, found_email in CustomUser.objects.filter(query).values_list('username', 'email')[:2]:
+            if found_username == candidates.get(USERNAME):
+                result[USERNAME] = False
+            if found_email == candidates.get(EMAIL):
+                result[EMAIL] = False
+    return result
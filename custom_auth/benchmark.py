@@ -0,0 +1,438 @@
+"""
+Нагрузочный бенчмарк эндпоинтов `custom_auth`.
+
+Запросы выполняются внутри процесса через настоящие WSGI- и ASGI-приложения
+проекта (`sr_auth_api.wsgi.application`, `sr_auth_api.asgi.application`), то есть
+проходят весь стек middleware, но без сети. Для каждого сценария собираются
+задержки (p50/p95/p99), пропускная способность и число SQL-запросов на запрос.
+Метрики считаются только по ответам с ожидаемым статусом: быстрые 503 или 500 не
+должны выглядеть как ускорение. Остальные ответы учитываются отдельно в `errors`.
+
+Запуск: ``python manage.py benchmark_auth`` (см. справку команды).
+"""
+import asyncio
+import contextvars
+import io
+import itertools
+import json
+import queue
+import threading
+import time
+import uuid
+
+from django.contrib.auth.hashers import make_password
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from .models import CustomUser
+from .tokens import RefreshToken
+
+BENCHMARK_PASSWORD = 'benchmark-Password-42'
+BENCHMARK_HOST = 'auth.drunar.space'
+
+# Счётчик SQL-запросов текущего HTTP-запроса. contextvars копируются
+# в поток sync_to_async, поэтому счёт работает и под ASGI.
+_query_counter = contextvars.ContextVar('benchmark_query_counter', default=None)
+
+
+def _count_queries(execute, sql, params, many, context):
+    counter = _query_counter.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def _install_query_counter(sender=None, connection=None, **kwargs):
+    if _count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_queries)
+
+
+def enable_query_counting():
+    """
+    Подключает счётчик запросов ко всем текущим и будущим соединениям с БД.
+    """
+    connection_created.connect(_install_query_counter, dispatch_uid='benchmark_query_counter')
+    for conn in connections.all():
+        _install_query_counter(connection=conn)
+
+
+def seed_users(count, prefix='bench'):
+    """
+    Быстро создаёт `count` пользователей одним `bulk_create`.
+
+    Хеш пароля вычисляется один раз и используется для всех пользователей,
+    поэтому время наполнения не зависит от стоимости хеширования.
+
+    :param count: Количество пользователей.
+    :type count: int
+    :param prefix: Префикс имён пользователей.
+    :type prefix: str
+    :return: Список созданных пользователей.
+    :rtype: list[CustomUser]
+    """
+    password = make_password(BENCHMARK_PASSWORD)
+    users = [
+        CustomUser(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com', password=password)
+        for i in range(count)
+    ]
+    return CustomUser.objects.bulk_create(users, batch_size=1000)
+
+
+def percentile(values, pct):
+    """
+    Возвращает перцентиль `pct` отсортированного списка методом ближайшего ранга.
+
+    :param values: Отсортированные значения.
+    :type values: list[float]
+    :param pct: Перцентиль от 0 до 100.
+    :type pct: float
+    :rtype: float
+    """
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * pct // 100))  # ceil без float-погрешностей
+    return values[int(rank) - 1]
+
+
+class BenchRequest:
+    """
+    Описание одного HTTP-запроса сценария.
+    """
+    __slots__ = ('method', 'path', 'body', 'cookies')
+
+    def __init__(self, method, path, body=None, cookies=None):
+        self.method = method
+        self.path = path
+        self.body = json.dumps(body).encode() if body is not None else b''
+        self.cookies = cookies or {}
+
+    @property
+    def cookie_header(self):
+        return '; '.join(f'{key}={value}' for key, value in self.cookies.items())
+
+
+def _token_cookies(user):
+    refresh = RefreshToken.for_user(user)
+    return {'access_token': str(refresh.access_token), 'refresh_token': str(refresh)}
+
+
+def build_scenarios(users, requests_per_scenario):
+    """
+    Готовит запросы для всех сценариев.
+
+    Токены для сценариев, которым нужна аутентификация, выпускаются напрямую,
+    без логина, чтобы хеширование пароля учитывалось только в сценарии `login`.
+
+    :param users: Засеянные пользователи.
+    :type users: list[CustomUser]
+    :param requests_per_scenario: Количество запросов в каждом сценарии.
+    :type requests_per_scenario: int
+    :return: ``{имя сценария: (ожидаемые статусы, список BenchRequest)}``.
+    :rtype: dict
+    """
+    n = requests_per_scenario
+    run_id = uuid.uuid4().hex[:8]
+    cycle = list(itertools.islice(itertools.cycle(users), n))
+    return {
+        'register': ({201}, [
+            BenchRequest('POST', '/auth/register/', {
+                'username': f'reg{run_id}{i}',
+                'email': f'reg{run_id}{i}@example.com',
+                'password': BENCHMARK_PASSWORD,
+            })
+            for i in range(n)
+        ]),
+        'login': ({200}, [
+            BenchRequest('POST', '/auth/login/', {'username': user.username, 'password': BENCHMARK_PASSWORD})
+            for user in cycle
+        ]),
+        'refresh': ({200}, [
+            BenchRequest('POST', '/auth/token/refresh/', cookies=_token_cookies(user))
+            for user in cycle
+        ]),
+        'profile_get': ({200}, [
+            BenchRequest('GET', '/auth/profile/', cookies=_token_cookies(user))
+            for user in cycle
+        ]),
+        'profile_patch': ({200}, [
+            BenchRequest('PATCH', '/auth/profile/', {'email': f'patched{run_id}{i}@example.com'},
+                         cookies=_token_cookies(user))
+            for i, user in enumerate(cycle)
+        ]),
+        'logout': ({205}, [
+            BenchRequest('POST', '/auth/logout/', cookies=_token_cookies(user))
+            for user in cycle
+        ]),
+    }
+
+
+def _wsgi_environ(request):
+    environ = {
+        'REQUEST_METHOD': request.method,
+        'PATH_INFO': request.path,
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': '',
+        'SERVER_NAME': BENCHMARK_HOST,
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1',
+        'HTTP_HOST': BENCHMARK_HOST,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(request.body)),
+        'wsgi.input': io.BytesIO(request.body),
+        'wsgi.errors': io.StringIO(),
+        'wsgi.url_scheme': 'http',
+        'wsgi.version': (1, 0),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    if request.cookies:
+        environ['HTTP_COOKIE'] = request.cookie_header
+    return environ
+
+
+def _asgi_scope(request):
+    headers = [
+        (b'host', BENCHMARK_HOST.encode()),
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(request.body)).encode()),
+    ]
+    if request.cookies:
+        headers.append((b'cookie', request.cookie_header.encode()))
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': request.method,
+        'scheme': 'http',
+        'path': request.path,
+        'raw_path': request.path.encode(),
+        'root_path': '',
+        'query_string': b'',
+        'headers': headers,
+        'client': ('127.0.0.1', 50000),
+        'server': (BENCHMARK_HOST, 80),
+    }
+
+
+class Sample:
+    """
+    Результат одного запроса.
+    """
+    __slots__ = ('latency', 'status', 'queries')
+
+    def __init__(self, latency, status, queries):
+        self.latency = latency
+        self.status = status
+        self.queries = queries
+
+
+def call_wsgi(application, request):
+    """
+    Выполняет запрос через WSGI-приложение и возвращает `Sample`.
+    """
+    counter = [0]
+    token = _query_counter.set(counter)
+    captured = {}
+
+    def start_response(status, headers, exc_info=None):
+        captured['status'] = int(status.split(' ', 1)[0])
+
+    started = time.perf_counter()
+    try:
+        result = application(_wsgi_environ(request), start_response)
+        try:
+            for _ in result:
+                pass
+        finally:
+            # Закрытие ответа отправляет request_finished (в т.ч. закрытие соединения с БД)
+            if hasattr(result, 'close'):
+                result.close()
+        latency = time.perf_counter() - started
+    finally:
+        _query_counter.reset(token)
+    return Sample(latency, captured.get('status', 0), counter[0])
+
+
+async def call_asgi(application, request):
+    """
+    Выполняет запрос через ASGI-приложение и возвращает `Sample`.
+    """
+    counter = [0]
+    token = _query_counter.set(counter)
+    captured = {}
+    body_sent = False
+
+    async def receive():
+        nonlocal body_sent
+        if body_sent:
+            # Django ждёт http.disconnect только после отправки ответа
+            await asyncio.Event().wait()
+        body_sent = True
+        return {'type': 'http.request', 'body': request.body, 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            captured['status'] = message['status']
+
+    started = time.perf_counter()
+    try:
+        await application(_asgi_scope(request), receive, send)
+        latency = time.perf_counter() - started
+    finally:
+        _query_counter.reset(token)
+    return Sample(latency, captured.get('status', 0), counter[0])
+
+
+def run_wsgi(application, requests, concurrency):
+    """
+    Прогоняет запросы через WSGI-приложение в `concurrency` потоках.
+
+    :return: Список `Sample` и общее время прогона в секундах.
+    :rtype: tuple[list[Sample], float]
+    """
+    pending = queue.SimpleQueue()
+    for request in requests:
+        pending.put(request)
+    samples = []
+    lock = threading.Lock()
+
+    def worker():
+        try:
+            while True:
+                try:
+                    request = pending.get_nowait()
+                except queue.Empty:
+                    return
+                sample = call_wsgi(application, request)
+                with lock:
+                    samples.append(sample)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - started
+
+
+def run_asgi(application, requests, concurrency):
+    """
+    Прогоняет запросы через ASGI-приложение с не более чем `concurrency` запросами одновременно.
+
+    :return: Список `Sample` и общее время прогона в секундах.
+    :rtype: tuple[list[Sample], float]
+    """
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(request):
+            async with semaphore:
+                return await call_asgi(application, request)
+
+        started = time.perf_counter()
+        samples = await asyncio.gather(*(one(request) for request in requests))
+        return list(samples), time.perf_counter() - started
+
+    return asyncio.run(main())
+
+
+def summarize(samples, elapsed, expected_statuses):
+    """
+    Сводит результаты сценария в словарь для отчёта.
+
+    Задержки, пропускная способность и запросы к БД считаются только по ответам с
+    ожидаемым статусом; остальные попадают в `errors` и `error_statuses`.
+
+    :rtype: dict
+    """
+    ok = [sample for sample in samples if sample.status in expected_statuses]
+    error_statuses = {}
+    for sample in samples:
+        if sample.status not in expected_statuses:
+            error_statuses[str(sample.status)] = error_statuses.get(str(sample.status), 0) + 1
+    latencies = sorted(sample.latency * 1000 for sample in ok)
+    count = len(ok)
+    return {
+        'requests': len(samples),
+        'errors': len(samples) - count,
+        'error_statuses': error_statuses,
+        'rps': round(count / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': {
+            'mean': round(sum(latencies) / count, 3) if count else 0.0,
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'max': round(latencies[-1], 3) if latencies else 0.0,
+        },
+        'queries_per_request': round(sum(sample.queries for sample in ok) / count, 2) if count else 0.0,
+    }
+
+
+def run_benchmark(server, scenarios, concurrency, warmup=0):
+    """
+    Выполняет сценарии и возвращает сводку по каждому.
+
+    :param server: ``'wsgi'`` или ``'asgi'``.
+    :type server: str
+    :param scenarios: Результат `build_scenarios` (возможно, отфильтрованный).
+    :type scenarios: dict
+    :param concurrency: Количество одновременных запросов.
+    :type concurrency: int
+    :param warmup: Сколько первых запросов каждого сценария не учитывать.
+    :type warmup: int
+    :return: ``{имя сценария: сводка}``.
+    :rtype: dict
+    """
+    if server == 'asgi':
+        from sr_auth_api.asgi import application
+        runner = run_asgi
+    else:
+        from sr_auth_api.wsgi import application
+        runner = run_wsgi
+
+    enable_query_counting()
+    results = {}
+    for name, (expected_statuses, requests) in scenarios.items():
+        if warmup:
+            runner(application, requests[:warmup], concurrency)
+            requests = requests[warmup:]
+        samples, elapsed = runner(application, requests, concurrency)
+        results[name] = summarize(samples, elapsed, expected_statuses)
+    return results
+
+
+def compare(baseline, current):
+    """
+    Сравнивает два отчёта и возвращает строки с изменениями по ключевым метрикам.
+
+    :param baseline: Предыдущий отчёт (результат `run_benchmark` из JSON).
+    :type baseline: dict
+    :param current: Текущий отчёт.
+    :type current: dict
+    :rtype: list[str]
+    """
+    lines = []
+    for name, result in current.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        metrics = [
+            ('p50', old['latency_ms']['p50'], result['latency_ms']['p50']),
+            ('p99', old['latency_ms']['p99'], result['latency_ms']['p99']),
+            ('rps', old['rps'], result['rps']),
+            ('queries', old['queries_per_request'], result['queries_per_request']),
+        ]
+        parts = []
+        for metric, before, after in metrics:
+            change = (after - before) / before * 100 if before else 0.0
+            parts.append(f'{metric} {before} -> {after} ({change:+.1f}%)')
+        errors = (old.get('errors', 0), result['errors'])
+        if any(errors):
+            parts.append(f'errors {errors[0]} -> {errors[1]} (not comparable)')
+        lines.append(f'{name}: ' + ', '.join(parts))
+    return lines
@@ -0,0 +1,231 @@
+"""
+Claims роли и прав пользователя в JWT-токенах.
+
+Токены, выпускаемые при логине и обновлении, содержат `role` и компактный список
+прав `perms` (``app_label.codename``). Сервисы проверяют права по токену и не
+обращаются к таблицам `groups`/`user_permissions` на каждый запрос.
+
+Кэш устроен в два уровня:
+    - для пользователя хранятся роль, id групп и личные права; при промахе они
+      загружаются одним SQL-запросом вместе с правами групп пользователя;
+    - права набора групп хранятся по сигнатуре набора, в которую входят версии групп.
+      Изменение прав группы увеличивает её версию, и все наборы с этой группой
+      становятся недействительными без перебора ключей.
+
+Для нескольких воркеров нужен общий кэш (`CACHES`), см. `CLAIMS_CACHE_ALIAS`:
+сигналы сбрасывают записи только в том кэше, который видит изменивший их процесс.
+Если кэш хранится в памяти процесса (`LocMemCache`), записи живут не дольше
+`CLAIMS_LOCAL_CACHE_TIMEOUT`, чтобы остальные воркеры недолго выдавали устаревшие claims.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import CharField, F, IntegerField, Value
+
+from .models import CustomUser
+
+ROLE_CLAIM = 'role'
+PERMISSIONS_CLAIM = 'perms'
+ALL_PERMISSIONS = '*'
+
+USER_KEY = 'auth:claims:user:{}'
+GROUP_VERSION_KEY = 'auth:claims:group-version:{}'
+GROUP_SET_KEY = 'auth:claims:groups:{}'
+
+
+def _cache():
+    return caches[getattr(settings, 'CLAIMS_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    timeout = getattr(settings, 'CLAIMS_CACHE_TIMEOUT', 3600)
+    if isinstance(_cache(), LocMemCache):
+        timeout = min(timeout, getattr(settings, 'CLAIMS_LOCAL_CACHE_TIMEOUT', 30))
+    return timeout
+
+
+def _role(is_staff):
+    return 'admin' if is_staff else 'user'
+
+
+def _load_memberships(user_id):
+    """
+    Загружает id групп, личные права и права групп пользователя одним запросом (UNION).
+
+    Строки различаются по заполненным колонкам: членство в группе — ``(gid, '', '')``,
+    личное право — ``(None, app, code)``, право группы — ``(gid, app, code)``.
+
+    :return: Список id групп, список личных прав и множество прав групп ``app_label.codename``.
+    :rtype: tuple[list[int], list[str], set[str]]
+    """
+    # Все части UNION состоят только из аннотаций с одинаковыми именами,
+    # чтобы порядок колонок в SQL совпадал
+    user_groups = CustomUser.groups.through.objects.filter(customuser_id=user_id).annotate(
+        gid=F('group_id'),
+        app=Value('', output_field=CharField()),
+        code=Value('', output_field=CharField()),
+    ).values_list('gid', 'app', 'code')
+    user_perms = CustomUser.user_permissions.through.objects.filter(customuser_id=user_id).annotate(
+        gid=Value(None, output_field=IntegerField()),
+        app=F('permission__content_type__app_label'),
+        code=F('permission__codename'),
+    ).values_list('gid', 'app', 'code')
+    group_perms = Group.permissions.through.objects.filter(group__user=user_id).annotate(
+        gid=F('group_id'),
+        app=F('permission__content_type__app_label'),
+        code=F('permission__codename'),
+    ).values_list('gid', 'app', 'code')
+
+    group_ids, perms, inherited = [], [], set()
+    for group_id, app_label, codename in user_groups.union(user_perms, group_perms, all=True):
+        if group_id is None:
+            perms.append(f'{app_label}.{codename}')
+        elif not app_label:
+            group_ids.append(group_id)
+        else:
+            inherited.add(f'{app_label}.{codename}')
+    return sorted(group_ids), perms, inherited
+
+
+def _user_claims(user_id, is_staff, is_superuser, is_active):
+    """
+    Возвращает claims по закэшированной записи пользователя. При промахе запись
+    строится одним запросом, который заодно возвращает права групп пользователя;
+    ими же заполняется кэш прав набора групп.
+    """
+    cache = _cache()
+    key = USER_KEY.format(user_id)
+    entry = cache.get(key)
+    if entry is not None:
+        return _claims_from_entry(entry)
+    entry = {'role': _role(is_staff), 'superuser': is_superuser, 'active': is_active}
+    inherited = set()
+    if is_active and not is_superuser:
+        entry['groups'], entry['perms'], inherited = _load_memberships(user_id)
+        if entry['groups']:
+            # Права набора групп уже загружены: кладём их в кэш, если там их ещё нет
+            cache.add(_group_set_key(entry['groups']), inherited, _timeout())
+    else:
+        entry['groups'], entry['perms'] = [], []
+    cache.set(key, entry, _timeout())
+    return _claims_from_entry(entry, inherited)
+
+
+def _group_set_key(group_ids):
+    """
+    Возвращает ключ кэша прав набора групп по сигнатуре с текущими версиями групп.
+    """
+    versions = _cache().get_many([GROUP_VERSION_KEY.format(group_id) for group_id in group_ids])
+    signature = ','.join(
+        f'{group_id}v{versions.get(GROUP_VERSION_KEY.format(group_id), 0)}' for group_id in group_ids
+    )
+    return GROUP_SET_KEY.format(hashlib.sha1(signature.encode()).hexdigest())
+
+
+def _group_set_permissions(group_ids):
+    """
+    Возвращает права набора групп из кэша по сигнатуре, при промахе — одним запросом.
+    """
+    if not group_ids:
+        return set()
+    cache = _cache()
+    key = _group_set_key(group_ids)
+    perms = cache.get(key)
+    if perms is None:
+        perms = {
+            f'{app_label}.{codename}'
+            for app_label, codename in Permission.objects.filter(group__id__in=group_ids).values_list(
+                'content_type__app_label', 'codename',
+            )
+        }
+        cache.set(key, perms, _timeout())
+    return perms
+
+
+def _claims_from_entry(entry, group_perms=None):
+    if entry['superuser'] and entry['active']:
+        perms = [ALL_PERMISSIONS]
+    else:
+        if group_perms is None:
+            group_perms = _group_set_permissions(entry['groups'])
+        perms = sorted(group_perms.union(entry['perms']))
+    return {ROLE_CLAIM: entry['role'], PERMISSIONS_CLAIM: perms}
+
+
+def get_user_claims(user):
+    """
+    Возвращает claims роли и прав пользователя.
+
+    :param user: Пользователь.
+    :type user: CustomUser
+    :return: ``{'role': ..., 'perms': [...]}``.
+    :rtype: dict
+    """
+    return _user_claims(user.pk, user.is_staff, user.is_superuser, user.is_active)
+
+
+def get_user_claims_by_id(user_id):
+    """
+    Возвращает claims по id пользователя (например, из refresh-токена).
+
+    При попадании в кэш обращения к БД нет.
+
+    :param user_id: Id пользователя.
+    :return: Claims или None, если пользователь не найден.
+    :rtype: dict or None
+    """
+    entry = _cache().get(USER_KEY.format(user_id))
+    if entry is None:
+        flags = CustomUser.objects.filter(pk=user_id).values_list('is_staff', 'is_superuser', 'is_active').first()
+        if flags is None:
+            return None
+        return _user_claims(user_id, *flags)
+    return _claims_from_entry(entry)
+
+
+def add_claims(token, claims):
+    """
+    Записывает claims в токен.
+
+    :param token: Токен simplejwt.
+    :type token: rest_framework_simplejwt.tokens.Token
+    :param claims: Результат `get_user_claims`.
+    :type claims: dict
+    :return: Тот же токен.
+    """
+    for name, value in claims.items():
+        token[name] = value
+    return token
+
+
+def invalidate_users(user_ids):
+    """
+    Удаляет закэшированные claims пользователей.
+
+    :param user_ids: Id пользователей.
+    :type user_ids: Iterable
+    """
+    keys = [USER_KEY.format(user_id) for user_id in user_ids]
+    if keys:
+        _cache().delete_many(keys)
+
+
+def invalidate_groups(group_ids):
+    """
+    Увеличивает версии групп: все наборы групп, содержащие их, становятся недействительными.
+
+    :param group_ids: Id групп.
+    :type group_ids: Iterable[int]
+    """
+    cache = _cache()
+    for group_id in group_ids:
+        key = GROUP_VERSION_KEY.format(group_id)
+        # add() не перезаписывает существующее значение, incr() атомарен в Redis/Memcached
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
@@ -0,0 +1,84 @@
+"""
+Подтверждение почты при регистрации.
+
+Токен подтверждения — подписанная `django.core.signing` пара (id пользователя,
+почта) с временем выпуска. Проверка подписи и срока (`EMAIL_CONFIRMATION_MAX_AGE`)
+не обращается к БД; активация — один ``UPDATE`` с условием, что почта не менялась и
+ещё не подтверждена, поэтому повторное использование токена ничего не меняет.
+
+Письмо не отправляется в запросе: `send_confirmation_email` ставит его в outbox
+(`custom_auth.outbox`) в транзакции регистрации.
+"""
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+from .models import CustomUser
+from .outbox import enqueue_email
+
+CONFIRMATION_SALT = 'custom_auth.confirm-email'
+CONFIRMATION_EMAIL = 'confirm_email'
+
+
+def make_confirmation_token(user):
+    """
+    Выпускает токен подтверждения почты пользователя.
+
+    :param user: Пользователь.
+    :type user: CustomUser
+    :rtype: str
+    """
+    return signing.dumps({'u': str(user.pk), 'e': user.email}, salt=CONFIRMATION_SALT, compress=True)
+
+
+def read_confirmation_token(token):
+    """
+    Проверяет подпись и срок токена без обращения к БД.
+
+    :param token: Токен из письма.
+    :type token: str
+    :return: ``(id пользователя, почта)`` или None, если токен неверен или истёк.
+    :rtype: tuple[str, str] or None
+    """
+    try:
+        data = signing.loads(token, salt=CONFIRMATION_SALT,
+                             max_age=getattr(settings, 'EMAIL_CONFIRMATION_MAX_AGE', 3 * 24 * 3600))
+    except signing.BadSignature:  # включая SignatureExpired
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get('u'), str) or not isinstance(data.get('e'), str):
+        return None
+    return data['u'], data['e']
+
+
+def confirm_email(token):
+    """
+    Подтверждает почту и активирует пользователя по токену.
+
+    :param token: Токен из письма.
+    :type token: str
+    :return: True, если почта подтверждена этим вызовом.
+    :rtype: bool
+    """
+    data = read_confirmation_token(token)
+    if data is None:
+        return False
+    user_id, email = data
+    return bool(CustomUser.objects.filter(pk=user_id, email=email, email_confirmed_at__isnull=True)
+                .update(is_active=True, email_confirmed_at=timezone.now()))
+
+
+def send_confirmation_email(user):
+    """
+    Ставит письмо с ссылкой подтверждения в outbox.
+
+    :param user: Зарегистрированный пользователь.
+    :type user: CustomUser
+    :rtype: custom_auth.models.OutboxMessage
+    """
+    url = settings.EMAIL_CONFIRMATION_URL.format(token=make_confirmation_token(user))
+    return enqueue_email(
+        CONFIRMATION_EMAIL,
+        user.email,
+        'Confirm your email',
+        f'Hello, {user.username}!\n\nConfirm your email by following the link:\n{url}\n',
+    )
@@ -0,0 +1,138 @@
+"""
+Установка и удаление cookies с JWT-токенами.
+
+`access_token` нужен всем сервисам и ставится на путь ``/`` домена
+`AUTH_COOKIE_DOMAIN`. `refresh_token` нужен только эндпоинтам этого сервиса
+(обновление токена, выход, сессии), поэтому ставится на их общий префикс
+`REFRESH_COOKIE_PATH`: браузер не отправляет его ни соседним сервисам, ни за статикой.
+
+Раньше `refresh_token` ставился на путь ``/``. Такая cookie живёт до истечения
+refresh-токена, и пока она есть, браузер отправляет обе. `get_refresh_cookie`
+берёт первую из них: браузеры перечисляют cookies с более длинным путём раньше
+(RFC 6265, 5.4), а `request.COOKIES` оставил бы последнюю, то есть старую.
+Выход же должен аннулировать обе: `get_refresh_cookies` возвращает все значения,
+а `delete_auth_cookies` удаляет и старую cookie на ``/``.
+"""
+import datetime
+from http.cookies import SimpleCookie
+
+from django.conf import settings
+from django.http.cookie import parse_cookie
+
+ACCESS_COOKIE = 'access_token'
+REFRESH_COOKIE = 'refresh_token'
+
+_COOKIE_OPTIONS = {
+    'httponly': True,
+    'secure': False,  # Установите True для HTTPS
+    'samesite': 'Lax',  # Ограничивает отправку токенов в разных контекстах
+}
+
+
+def _domain():
+    return getattr(settings, 'AUTH_COOKIE_DOMAIN', None)
+
+
+def refresh_cookie_path():
+    """
+    Возвращает путь, на который ставится cookie `refresh_token`.
+
+    :rtype: str
+    """
+    return getattr(settings, 'REFRESH_COOKIE_PATH', '/')
+
+
+def get_refresh_cookies(request):
+    """
+    Возвращает все refresh-токены из заголовка Cookie в порядке их следования.
+
+    :param request: HTTP-запрос.
+    :type request: django.http.HttpRequest
+    :return: Непустые значения cookies `refresh_token`.
+    :rtype: list[str]
+    """
+    header = request.META.get('HTTP_COOKIE', '')
+    if header.count(f'{REFRESH_COOKIE}=') <= 1:
+        value = request.COOKIES.get(REFRESH_COOKIE)
+        return [value] if value else []
+    values = []
+    for chunk in header.split(';'):
+        if chunk.strip().partition('=')[0] == REFRESH_COOKIE:
+            value = parse_cookie(chunk).get(REFRESH_COOKIE)
+            if value and value not in values:
+                values.append(value)
+    return values
+
+
+def get_refresh_cookie(request):
+    """
+    Возвращает refresh-токен из cookies запроса, предпочитая cookie с самым длинным путём.
+
+    :param request: HTTP-запрос.
+    :type request: django.http.HttpRequest
+    :return: Refresh-токен или None.
+    :rtype: str or None
+    """
+    values = get_refresh_cookies(request)
+    return values[0] if values else None
+
+
+def set_access_cookie(response, access_token):
+    """
+    Устанавливает cookie `access_token` для всех поддоменов.
+
+    :param response: HTTP-ответ.
+    :type response: django.http.HttpResponse
+    :param access_token: Access-токен.
+    """
+    response.set_cookie(
+        ACCESS_COOKIE,
+        str(access_token),
+        expires=datetime.datetime.utcnow() + datetime.timedelta(minutes=60),
+        domain=_domain(),
+        **_COOKIE_OPTIONS,
+    )
+
+
+def set_refresh_cookie(response, refresh_token):
+    """
+    Устанавливает cookie `refresh_token` на путь `REFRESH_COOKIE_PATH`.
+
+    :param response: HTTP-ответ.
+    :type response: django.http.HttpResponse
+    :param refresh_token: Refresh-токен.
+    """
+    response.set_cookie(
+        REFRESH_COOKIE,
+        str(refresh_token),
+        expires=datetime.datetime.utcnow() + datetime.timedelta(days=10),
+        path=refresh_cookie_path(),
+        domain=_domain(),
+        **_COOKIE_OPTIONS,
+    )
+
+
+def delete_auth_cookies(response):
+    """
+    Удаляет cookies с токенами.
+
+    :param response: HTTP-ответ.
+    :type response: django.http.HttpResponse
+    """
+    response.delete_cookie(ACCESS_COOKIE, domain=_domain(), samesite=_COOKIE_OPTIONS['samesite'])
+    response.delete_cookie(REFRESH_COOKIE, path=refresh_cookie_path(), domain=_domain(),
+                           samesite=_COOKIE_OPTIONS['samesite'])
+    if refresh_cookie_path() != '/':
+        # Старая cookie на ``/``: в `response.cookies` одна запись на имя, поэтому
+        # удаляющий её Set-Cookie добавляется отдельным заголовком
+        legacy = SimpleCookie()
+        legacy[REFRESH_COOKIE] = ''
+        legacy[REFRESH_COOKIE].update({
+            'path': '/',
+            'max-age': 0,
+            'expires': 'Thu, 01 Jan 1970 00:00:00 GMT',
+            'samesite': _COOKIE_OPTIONS['samesite'],
+        })
+        if _domain():
+            legacy[REFRESH_COOKIE]['domain'] = _domain()
+        response.headers['Set-Cookie'] = legacy[REFRESH_COOKIE].OutputString()
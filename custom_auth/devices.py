@@ -0,0 +1,122 @@
+"""
+Реестр сессий (устройств) пользователя поверх `OutstandingToken`.
+
+Каждый refresh-токен, выпущенный при логине, — это сессия. К нему привязывается
+`TokenDevice` с User-Agent и IP клиента. Живые сессии — невыпавшие из срока и не
+занесённые в blacklist токены; выборка идёт по индексу ``(user_id, expires_at)``
+(миграция 0003), поэтому истёкшие токены пользователя не читаются.
+
+Отзыв выполняется одним запросом ``INSERT ... SELECT``: в blacklist заносятся сразу
+все подходящие токены пользователя, без загрузки их в Python и цикла по ним.
+"""
+from django.db import connection
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import TokenBackendError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from .models import TokenDevice
+from .tokens import compact_token_backend
+
+
+def token_jti(raw_token):
+    """
+    Возвращает `jti` токена, проверив только подпись и срок (без запросов к БД).
+
+    :param raw_token: Закодированный токен (например, из cookie).
+    :type raw_token: str or None
+    :return: `jti` или None, если токен отсутствует или недействителен.
+    :rtype: str or None
+    """
+    if not raw_token:
+        return None
+    try:
+        return compact_token_backend.decode(raw_token).get(api_settings.JTI_CLAIM)
+    except TokenBackendError:
+        return None
+
+
+def register_device(raw_refresh_token, request):
+    """
+    Привязывает к выпущенному refresh-токену данные устройства клиента.
+
+    :param raw_refresh_token: Закодированный refresh-токен, только что выпущенный при логине.
+    :type raw_refresh_token: str
+    :param request: HTTP-запрос логина.
+    :type request: rest_framework.request.Request
+    :return: Созданная запись или None, если `jti` не удалось получить.
+    :rtype: TokenDevice or None
+    """
+    jti = token_jti(raw_refresh_token)
+    if jti is None:
+        return None
+    return TokenDevice.objects.create(
+        token_id=jti,
+        user_agent=request.META.get('HTTP_USER_AGENT', '')[:255],
+        ip_address=request.META.get('REMOTE_ADDR') or None,
+    )
+
+
+def live_sessions(user):
+    """
+    Возвращает живые сессии пользователя одним запросом, новые — первыми.
+
+    :param user: Пользователь.
+    :type user: CustomUser
+    :return: Словари с `jti`, `created_at`, `expires_at`, `user_agent`, `ip_address`.
+    :rtype: list[dict]
+    """
+    rows = OutstandingToken.objects.filter(
+        user=user,
+        expires_at__gt=timezone.now(),
+        blacklistedtoken__isnull=True,
+    ).order_by('-created_at').values(
+        'jti', 'created_at', 'expires_at', 'device__user_agent', 'device__ip_address',
+    )
+    return [
+        {
+            'jti': row['jti'],
+            'created_at': row['created_at'],
+            'expires_at': row['expires_at'],
+            'user_agent': row['device__user_agent'] or '',
+            'ip_address': row['device__ip_address'],
+        }
+        for row in rows
+    ]
+
+
+def revoke_sessions(user, jti=None):
+    """
+    Заносит в blacklist живые refresh-токены пользователя одним ``INSERT ... SELECT``.
+
+    Истёкшие токены пропускаются (по индексу), уже отозванные — отсекаются
+    ``NOT EXISTS``, а ``ON CONFLICT`` защищает от гонки с параллельным отзывом.
+
+    :param user: Пользователь.
+    :type user: CustomUser
+    :param jti: `jti` одной сессии; если не задан, отзываются все сессии.
+    :type jti: str or None
+    :return: Количество отозванных токенов.
+    :rtype: int
+    """
+    quote = connection.ops.quote_name
+    outstanding = quote(OutstandingToken._meta.db_table)
+    blacklisted = quote(BlacklistedToken._meta.db_table)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    sql = (
+        f'INSERT INTO {blacklisted} ("token_id", "blacklisted_at") '
+        f'SELECT ot."id", %s FROM {outstanding} ot '
+        f'WHERE ot."user_id" = %s AND ot."expires_at" > %s'
+    )
+    user_id = OutstandingToken._meta.get_field('user').get_db_prep_value(user.pk, connection)
+    params = [now, user_id, now]
+    if jti is not None:
+        sql += ' AND ot."jti" = %s'
+        params.append(jti)
+    sql += (
+        f' AND NOT EXISTS (SELECT 1 FROM {blacklisted} b WHERE b."token_id" = ot."id")'
+        f' ON CONFLICT ("token_id") DO NOTHING'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
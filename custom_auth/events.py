@@ -0,0 +1,372 @@
+"""
+Буферизованный журнал событий аутентификации.
+
+На пути запроса `record_event` только собирает словарь события и кладёт его в
+ограниченную очередь в памяти. Фоновый поток `AuthEventRecorder` забирает события
+пакетами и передаёт их приёмнику, когда набралось `AUTH_EVENTS_BATCH_SIZE`
+событий или с момента первого события пакета прошло `AUTH_EVENTS_FLUSH_INTERVAL`
+секунд.
+
+Приёмники (`AUTH_EVENTS_SINK`):
+    - ``database`` — `bulk_create` в таблицу `AuthEvent`;
+    - ``jsonl`` — дописывание строк JSON в локальный файл `AUTH_EVENTS_FILE`;
+    - ``memory`` — список в памяти, используется в тестах (как `mail.outbox`).
+
+Поведение при переполнении очереди (`AUTH_EVENTS_OVERFLOW`):
+    - ``drop`` — событие сразу отбрасывается, запрос не ждёт;
+    - ``block`` — запрос ждёт свободного места не дольше `AUTH_EVENTS_BLOCK_TIMEOUT`
+      секунд, затем событие отбрасывается.
+
+Глубина очереди, число отброшенных событий и длительность сброса доступны через
+`AuthEventRecorder.stats()`. Фоновый поток раз в `AUTH_EVENTS_STATS_INTERVAL`
+секунд (если были события) и при остановке пишет их в лог `custom_auth.events`
+(INFO, поля в ``extra``), `benchmark_auth` добавляет их в отчёт. Каждый сброс
+пишется в лог с уровнем DEBUG, переполнение — WARNING.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import AuthEvent
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class DatabaseSink:
+    """
+    Пишет пакет событий в `AuthEvent` одним `bulk_create`.
+    """
+    def write(self, events):
+        # Поток не обслуживает запросы, поэтому соединением управляем сами
+        close_old_connections()
+        try:
+            AuthEvent.objects.bulk_create([AuthEvent(**event) for event in events])
+        finally:
+            close_old_connections()
+
+
+class JSONLFileSink:
+    """
+    Дописывает пакет событий в файл, по одной строке JSON на событие.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, events):
+        lines = ''.join(json.dumps(event, default=str, ensure_ascii=False) + '\n' for event in events)
+        with open(self.path, 'a', encoding='utf-8') as fh:
+            fh.write(lines)
+
+
+class MemorySink:
+    """
+    Складывает события в список `events` (для тестов).
+    """
+    def __init__(self):
+        self.events = []
+
+    def write(self, events):
+        self.events.extend(events)
+
+
+def build_sink(name=None):
+    """
+    Создаёт приёмник по имени из `AUTH_EVENTS_SINK`.
+
+    :param name: ``database``, ``jsonl`` или ``memory``.
+    :type name: str or None
+    :return: Приёмник с методом ``write(events)``.
+    :raises ValueError: Если имя неизвестно.
+    """
+    name = name or getattr(settings, 'AUTH_EVENTS_SINK', 'database')
+    if name == 'database':
+        return DatabaseSink()
+    if name == 'jsonl':
+        return JSONLFileSink(getattr(settings, 'AUTH_EVENTS_FILE', 'auth_events.jsonl'))
+    if name == 'memory':
+        return MemorySink()
+    raise ValueError(f'Unknown AUTH_EVENTS_SINK: {name!r}')
+
+
+class AuthEventRecorder:
+    """
+    Ограниченная очередь событий и фоновый поток, сбрасывающий их пакетами.
+
+    Поток запускается при первом событии в процессе; после fork (gunicorn с
+    `preload_app`) в дочернем процессе создаются новая очередь и новый поток.
+    """
+    OVERFLOW_MODES = ('drop', 'block')
+
+    def __init__(self, sink, batch_size=500, flush_interval=1.0, maxsize=10000,
+                 overflow='drop', block_timeout=0.05, autostart=True, stats_interval=60.0):
+        """
+        :param sink: Приёмник с методом ``write(events)``.
+        :param batch_size: Размер пакета, при котором сброс выполняется сразу.
+        :type batch_size: int
+        :param flush_interval: Максимальное время ожидания пакета, в секундах.
+        :type flush_interval: float
+        :param maxsize: Максимальная длина очереди.
+        :type maxsize: int
+        :param overflow: ``drop`` или ``block``.
+        :type overflow: str
+        :param block_timeout: Максимальное ожидание места в очереди в режиме ``block``.
+        :type block_timeout: float
+        :param autostart: Запускать ли фоновый поток; без него события сбрасывает `flush()`.
+        :type autostart: bool
+        :param stats_interval: Период записи `stats()` в лог фоновым потоком, в секундах; 0 — не писать.
+        :type stats_interval: float
+        """
+        if overflow not in self.OVERFLOW_MODES:
+            raise ValueError(f'Unknown overflow mode: {overflow!r}')
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.autostart = autostart
+        self.stats_interval = stats_interval
+        self.queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = os.getpid()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.dropped = 0
+        self._reported_dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+        self.last_flush_ms = None
+        self.max_flush_ms = 0.0
+        self._logged_totals = (0, 0, 0)
+
+    def stats(self):
+        """
+        Возвращает показатели очереди текущего процесса.
+
+        :return: ``queue_depth``, ``dropped``, ``written``, ``failed``, ``flushes``,
+            ``last_flush_ms``, ``max_flush_ms``.
+        :rtype: dict
+        """
+        return {
+            'queue_depth': self.queue.qsize(),
+            'dropped': self.dropped,
+            'written': self.written,
+            'failed': self.failed,
+            'flushes': self.flushes,
+            'last_flush_ms': self.last_flush_ms,
+            'max_flush_ms': self.max_flush_ms,
+        }
+
+    def record(self, event):
+        """
+        Ставит событие в очередь, не выполняя ввода-вывода.
+
+        :param event: Поля `AuthEvent`.
+        :type event: dict
+        :return: False, если событие отброшено из-за переполнения.
+        :rtype: bool
+        """
+        self._ensure_started()
+        try:
+            if self.overflow == 'block':
+                self.queue.put(event, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(event)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        return True
+
+    def _ensure_started(self):
+        if self._pid == os.getpid() and (self._thread is not None or not self.autostart):
+            return
+        if self._pid != os.getpid():
+            # Очередь, блокировка и поток родителя в дочернем процессе недействительны
+            # (блокировка могла быть захвачена в момент fork), поэтому создаём новые
+            self.queue = queue.Queue(maxsize=self.queue.maxsize)
+            self._lock = threading.Lock()
+            self._thread = None
+            self._pid = os.getpid()
+            self._reset_stats()
+        with self._lock:
+            if self._thread is None and self.autostart:
+                self._thread = threading.Thread(target=self._run, name='auth-events-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        batch = []
+        deadline = None
+        stats_due = time.monotonic() + self.stats_interval if self.stats_interval else None
+        while True:
+            timeout = self.flush_interval if deadline is None else max(0.0, deadline - time.monotonic())
+            if stats_due is not None:
+                timeout = min(timeout, max(0.0, stats_due - time.monotonic()))
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                self._write(batch)
+                self.log_stats()
+                return
+            if stats_due is not None and time.monotonic() >= stats_due:
+                self.log_stats()
+                stats_due = time.monotonic() + self.stats_interval
+            if item is not None:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._write(batch)
+                batch = []
+                deadline = None
+
+    def _write(self, batch):
+        """
+        Передаёт пакет приёмнику и обновляет показатели.
+        """
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            self.sink.write(batch)
+        except Exception:
+            self.failed += len(batch)
+            logger.exception('Failed to write %d auth events', len(batch))
+        else:
+            self.written += len(batch)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.flushes += 1
+        self.last_flush_ms = round(elapsed_ms, 3)
+        self.max_flush_ms = max(self.max_flush_ms, self.last_flush_ms)
+        logger.debug('Flushed %d auth events', len(batch), extra={
+            'batch_size': len(batch), 'flush_ms': self.last_flush_ms, 'queue_depth': self.queue.qsize(),
+        })
+        self._report_dropped()
+
+    def log_stats(self):
+        """
+        Пишет `stats()` в лог, если с прошлой записи были события.
+        """
+        totals = (self.written, self.failed, self.dropped)
+        if totals == self._logged_totals:
+            return
+        self._logged_totals = totals
+        stats = self.stats()
+        logger.info('Auth event recorder: %d written, %d failed, %d dropped, queue depth %d',
+                    stats['written'], stats['failed'], stats['dropped'], stats['queue_depth'], extra=stats)
+
+    def _report_dropped(self):
+        lost = self.dropped - self._reported_dropped
+        if lost:
+            self._reported_dropped += lost
+            logger.warning('Auth event queue overflow: %d events dropped', lost, extra={
+                'dropped_total': self.dropped, 'queue_depth': self.queue.qsize(),
+            })
+
+    def flush(self):
+        """
+        Синхронно сбрасывает всё, что накопилось в очереди, в текущем потоке.
+        """
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _STOP:
+                    batch.append(item)
+            if not batch:
+                return
+            self._write(batch)
+
+    def close(self, timeout=5.0):
+        """
+        Останавливает фоновый поток, дописав оставшиеся события.
+
+        :param timeout: Максимальное ожидание потока, в секундах.
+        :type timeout: float
+        """
+        if self._pid != os.getpid():
+            return  # события в унаследованной очереди принадлежат родителю
+        thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self.queue.put(_STOP)
+            thread.join(timeout)
+        else:
+            self.flush()
+            self.log_stats()
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def get_recorder():
+    """
+    Возвращает общий для процесса `AuthEventRecorder`, созданный по настройкам.
+
+    :rtype: AuthEventRecorder
+    """
+    global _recorder
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = AuthEventRecorder(
+                    build_sink(),
+                    batch_size=getattr(settings, 'AUTH_EVENTS_BATCH_SIZE', 500),
+                    flush_interval=getattr(settings, 'AUTH_EVENTS_FLUSH_INTERVAL', 1.0),
+                    maxsize=getattr(settings, 'AUTH_EVENTS_QUEUE_SIZE', 10000),
+                    overflow=getattr(settings, 'AUTH_EVENTS_OVERFLOW', 'drop'),
+                    block_timeout=getattr(settings, 'AUTH_EVENTS_BLOCK_TIMEOUT', 0.05),
+                    stats_interval=getattr(settings, 'AUTH_EVENTS_STATS_INTERVAL', 60.0),
+                )
+                atexit.register(close_recorder)
+    return _recorder
+
+
+def close_recorder():
+    """
+    Дописывает оставшиеся события и останавливает фоновый поток, если он создан.
+    """
+    if _recorder is not None:
+        _recorder.close()
+
+
+def record_event(event, request, user=None, username=''):
+    """
+    Ставит событие аутентификации в очередь.
+
+    :param event: Тип события (`AuthEvent.LOGIN_SUCCESS` и т. д.).
+    :type event: str
+    :param request: HTTP-запрос, из которого берутся IP и User-Agent.
+    :type request: rest_framework.request.Request
+    :param user: Пользователь или его id, если известен.
+    :param username: Имя пользователя из запроса, если пользователь не известен.
+    :type username: str
+    :return: False, если событие отброшено из-за переполнения очереди.
+    :rtype: bool
+    """
+    user_id = getattr(user, 'pk', user)
+    return get_recorder().record({
+        'event': event,
+        'user_id': str(user_id) if user_id is not None else None,
+        'username': (getattr(user, 'username', None) or username or '')[:150],
+        'ip_address': request.META.get('REMOTE_ADDR') or None,
+        'user_agent': request.META.get('HTTP_USER_AGENT', '')[:255],
+        'created_at': timezone.now(),
+    })
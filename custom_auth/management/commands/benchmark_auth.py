@@ -0,0 +1,149 @@
+import datetime
+import json
+import platform
+import subprocess
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+from custom_auth import admission, benchmark
+from custom_auth.events import close_recorder, get_recorder
+
+SCENARIOS = ('register', 'login', 'refresh', 'profile_get', 'profile_patch', 'logout')
+
+
+class Command(BaseCommand):
+    """
+    Нагрузочный бенчмарк эндпоинтов `custom_auth` внутри процесса.
+
+    Создаёт отдельную тестовую БД (SQLite или локальный PostgreSQL из настроек),
+    засевает пользователей, прогоняет сценарии через WSGI- или ASGI-приложение и
+    сохраняет результаты в JSON для сравнения между коммитами.
+
+    Пример::
+
+        DATABASE_SQLITE_AUTH=/tmp/auth.sqlite3 python manage.py benchmark_auth \\
+            --users 10000 --requests 500 --concurrency 8 --server wsgi --output bench.json
+    """
+    help = 'Benchmark custom_auth endpoints in-process and report latency percentiles.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of users to seed.')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario.')
+        parser.add_argument('--concurrency', type=int, default=4, help='Concurrent in-flight requests.')
+        parser.add_argument('--warmup', type=int, default=10,
+                            help='Leading requests of each scenario excluded from the results.')
+        parser.add_argument('--server', choices=('wsgi', 'asgi'), default='wsgi')
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                            help=f'Comma-separated subset of: {", ".join(SCENARIOS)}.')
+        parser.add_argument('--output', help='Write results as JSON to this file.')
+        parser.add_argument('--compare', help='Previous JSON results to compare against.')
+        parser.add_argument('--full-middleware', action='store_true',
+                            help='Run API requests through the full middleware stack (API_PATH_PREFIXES=()) '
+                                 'to measure the overhead saved by the slim API chain.')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the benchmark database afterwards.')
+        parser.add_argument('--admission', action='store_true',
+                            help='Keep the configured admission gate for login/register. By default the gate '
+                                 'admits --concurrency requests so the benchmark measures hashing, not 503s.')
+
+    def handle(self, *args, **options):
+        selected = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(selected) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+        if options['requests'] <= options['warmup']:
+            raise CommandError('--requests must be greater than --warmup.')
+
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        try:
+            users = benchmark.seed_users(options['users'])
+            scenarios = benchmark.build_scenarios(users, options['requests'])
+            scenarios = {name: scenarios[name] for name in selected}
+            api_prefixes = () if options['full_middleware'] else settings.API_PATH_PREFIXES
+            configured_gate = admission.hashing_gate
+            gate = configured_gate if options['admission'] else admission.AdmissionGate(limit=options['concurrency'])
+            admission.hashing_gate = gate
+            try:
+                with override_settings(API_PATH_PREFIXES=api_prefixes):
+                    results = benchmark.run_benchmark(
+                        options['server'], scenarios, options['concurrency'], warmup=options['warmup'],
+                    )
+            finally:
+                admission.hashing_gate = configured_gate
+            vendor = connection.vendor
+        finally:
+            # Журнал событий дописывается в БД бенчмарка до её удаления
+            close_recorder()
+            auth_events = get_recorder().stats()
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+
+        report = {
+            'meta': {
+                'commit': self.git_commit(),
+                'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'server': options['server'],
+                'database': vendor,
+                'users': options['users'],
+                'requests': options['requests'],
+                'warmup': options['warmup'],
+                'concurrency': options['concurrency'],
+                'middleware': 'full' if options['full_middleware'] else 'api',
+                'admission': {
+                    'gate': 'configured' if options['admission'] else 'concurrency',
+                    'limit': gate.limit,
+                    'queue_size': gate.queue_size,
+                    'rejected': gate.rejected,
+                },
+                'python': platform.python_version(),
+                'django': django.get_version(),
+            },
+            'results': results,
+            'auth_events': auth_events,
+        }
+
+        for name, result in results.items():
+            latency = result['latency_ms']
+            self.stdout.write(
+                f'{name:<14} rps={result["rps"]:<9} p50={latency["p50"]}ms p95={latency["p95"]}ms '
+                f'p99={latency["p99"]}ms queries/req={result["queries_per_request"]} errors={result["errors"]}'
+            )
+
+        self.stdout.write(
+            f'auth events: written={auth_events["written"]} dropped={auth_events["dropped"]} '
+            f'failed={auth_events["failed"]} max_flush={auth_events["max_flush_ms"]}ms'
+        )
+        if gate.rejected:
+            self.stdout.write(self.style.WARNING(
+                f'admission: {gate.rejected} login/register requests rejected with 503 '
+                f'(limit={gate.limit}, queue={gate.queue_size})'
+            ))
+
+        if options['compare']:
+            with open(options['compare']) as fh:
+                baseline = json.load(fh)
+            self.stdout.write(f'\nCompared with {baseline["meta"].get("commit")}:')
+            for line in benchmark.compare(baseline['results'], results):
+                self.stdout.write(line)
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(report, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+
+        failed = {name: result['error_statuses'] for name, result in results.items() if result['errors']}
+        if failed:
+            # Ненулевой код выхода: сравнение с такими результатами сравнивало бы пути ошибок
+            raise CommandError('Unexpected response statuses (excluded from latency and rps): ' + ', '.join(
+                f'{name} {statuses}' for name, statuses in failed.items()))
+
+    @staticmethod
+    def git_commit():
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,67 @@
+import logging
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+
+from custom_auth.outbox import send_pending
+
+logger = logging.getLogger('custom_auth.outbox')
+
+
+class Command(BaseCommand):
+    """
+    Воркер транзакционного outbox (`custom_auth.outbox`).
+
+    Отправляет ожидающие письма пакетами; если писем нет, засыпает на ``--interval``
+    секунд. Пакеты выбираются с ``FOR UPDATE SKIP LOCKED``, поэтому воркеров можно
+    запускать несколько (в том числе на разных серверах) — письмо отправит только один.
+    SIGTERM и SIGINT завершают воркер после текущего пакета. Ошибка пакета (например,
+недоступная БД) пишется в лог, и воркер продолжает работу после паузы; с ``--once``
+команда завершается с ошибкой.
+
+    Пример::
+
+        python manage.py send_outbox --batch-size 50 --interval 2
+    """
+    help = 'Send pending outbox emails.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='Messages claimed per transaction.')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep when the outbox is empty.')
+        parser.add_argument('--once', action='store_true', help='Drain the outbox once and exit.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+        self._stopping = False
+        if not options['once']:
+            signal.signal(signal.SIGTERM, self._stop)
+            signal.signal(signal.SIGINT, self._stop)
+
+        total_sent = total_failed = 0
+        while not self._stopping:
+            try:
+                sent, failed = send_pending(options['batch_size'])
+            except Exception as exc:
+                if options['once']:
+                    raise CommandError(f'Outbox batch failed: {exc}') from exc
+                logger.exception('Outbox batch failed')
+                sent = failed = 0
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write(f'Sent {sent}, failed {failed}.')
+            if sent + failed < options['batch_size']:
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+            if not options['once'] and not connection.in_atomic_block:
+                # Воркер живёт долго: между пакетами соединение переоткрывается по
+                # CONN_MAX_AGE и после ошибок, как между запросами
+                close_old_connections()
+        self.stdout.write(self.style.SUCCESS(f'Done: sent {total_sent}, failed {total_failed}.'))
+
+    def _stop(self, signum, frame):
+        self._stopping = True
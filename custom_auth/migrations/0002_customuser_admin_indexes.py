@@ -0,0 +1,77 @@
+# Generated by Django 5.1.1 on 2026-10-19 02:30
+
+from django.db import migrations, models
+
+PARTIAL_INDEXES = [
+    models.Index(condition=models.Q(('is_staff', True)), fields=['email'], name='customuser_staff_email_idx'),
+    models.Index(condition=models.Q(('is_active', False)), fields=['email'], name='customuser_inactive_email_idx'),
+]
+
+# Триграммные индексы для поиска в админке (icontains -> UPPER("col"::text) LIKE ...),
+# только PostgreSQL, в состоянии моделей не отражаются
+TRIGRAM_INDEXES = {
+    'customuser_email_trgm_idx': 'email',
+    'customuser_username_trgm_idx': 'username',
+}
+
+
+def _is_postgresql(schema_editor):
+    return schema_editor.connection.vendor == 'postgresql'
+
+
+def add_partial_indexes(apps, schema_editor):
+    model = apps.get_model('custom_auth', 'CustomUser')
+    for index in PARTIAL_INDEXES:
+        if _is_postgresql(schema_editor):
+            schema_editor.add_index(model, index, concurrently=True)
+        else:
+            schema_editor.add_index(model, index)
+
+
+def remove_partial_indexes(apps, schema_editor):
+    model = apps.get_model('custom_auth', 'CustomUser')
+    for index in PARTIAL_INDEXES:
+        if _is_postgresql(schema_editor):
+            schema_editor.remove_index(model, index, concurrently=True)
+        else:
+            schema_editor.remove_index(model, index)
+
+
+def add_trigram_indexes(apps, schema_editor):
+    if not _is_postgresql(schema_editor):
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, column in TRIGRAM_INDEXES.items():
+        schema_editor.execute(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" '
+            f'ON "custom_auth_customuser" USING gin (UPPER("{column}"::text) gin_trgm_ops)'
+        )
+
+
+def remove_trigram_indexes(apps, schema_editor):
+    if not _is_postgresql(schema_editor):
+        return
+    for name in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не работает внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('custom_auth', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name='customuser', index=index) for index in PARTIAL_INDEXES
+            ],
+            database_operations=[
+                migrations.RunPython(add_partial_indexes, remove_partial_indexes),
+            ],
+        ),
+        migrations.RunPython(add_trigram_indexes, remove_trigram_indexes),
+    ]
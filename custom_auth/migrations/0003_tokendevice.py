@@ -0,0 +1,43 @@
+# Generated by Django 5.1.1 on 2026-10-19 02:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Индекс для реестра сессий: живые токены пользователя (user_id, expires_at > now).
+# Таблица принадлежит token_blacklist, поэтому индекс создаётся SQL-ом, а не через Meta.
+OUTSTANDING_TOKEN_USER_EXPIRY_INDEX = 'outstandingtoken_user_exp_idx'
+
+
+def add_outstanding_token_index(apps, schema_editor):
+    concurrently = 'CONCURRENTLY ' if schema_editor.connection.vendor == 'postgresql' else ''
+    schema_editor.execute(
+        f'CREATE INDEX {concurrently}IF NOT EXISTS "{OUTSTANDING_TOKEN_USER_EXPIRY_INDEX}" '
+        f'ON "token_blacklist_outstandingtoken" ("user_id", "expires_at")'
+    )
+
+
+def remove_outstanding_token_index(apps, schema_editor):
+    concurrently = 'CONCURRENTLY ' if schema_editor.connection.vendor == 'postgresql' else ''
+    schema_editor.execute(f'DROP INDEX {concurrently}IF EXISTS "{OUTSTANDING_TOKEN_USER_EXPIRY_INDEX}"')
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не работает внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('custom_auth', '0002_customuser_admin_indexes'),
+        ('token_blacklist', '0012_alter_outstandingtoken_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenDevice',
+            fields=[
+                ('token', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='device', serialize=False, to='token_blacklist.outstandingtoken', to_field='jti')),
+                ('user_agent', models.CharField(blank=True, max_length=255)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(add_outstanding_token_index, remove_outstanding_token_index),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.1 on 2026-10-19 02:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_auth', '0003_tokendevice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(choices=[('login_success', 'Login success'), ('login_failure', 'Login failure'), ('refresh', 'Token refresh'), ('logout', 'Logout'), ('register', 'Registration')], max_length=20)),
+                ('user_id', models.UUIDField(blank=True, db_index=True, null=True)),
+                ('username', models.CharField(blank=True, max_length=150)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('user_agent', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
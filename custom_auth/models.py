@@ -1,6 +1,7 @@
 import uuid
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.db import models
+from django.utils import timezone
 
 
 class CustomUserManager(BaseUserManager):
@@ -64,6 +65,7 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
         - `is_active` (BooleanField): Активен ли пользователь.
         - `is_staff` (BooleanField): Является ли пользователь сотрудником (имеет доступ к админ-панели).
         - `is_superuser` (BooleanField): Является ли пользователь суперпользователем.
+        - `email_confirmed_at` (DateTimeField): Когда подтверждена почта (None — не подтверждена).
         - `objects` (CustomUserManager): Менеджер для модели `CustomUser`.
         - `USERNAME_FIELD` (str): Поле, используемое для аутентификации (в данном случае `username`).
         - `REQUIRED_FIELDS` (list): Список полей, необходимых при создании суперпользователя.
@@ -74,12 +76,21 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
     is_superuser = models.BooleanField(default=False)
+    email_confirmed_at = models.DateTimeField(null=True, blank=True)
 
     objects = CustomUserManager()
 
     USERNAME_FIELD = 'username'
     REQUIRED_FIELDS = ['email']
 
+    class Meta:
+        # Частичные индексы для фильтров админки (is_staff / не активные) с сортировкой по email.
+        # Создаются в миграции 0002 через CREATE INDEX CONCURRENTLY на PostgreSQL.
+        indexes = [
+            models.Index(fields=['email'], condition=models.Q(is_staff=True), name='customuser_staff_email_idx'),
+            models.Index(fields=['email'], condition=models.Q(is_active=False), name='customuser_inactive_email_idx'),
+        ]
+
     def __str__(self):
         """
         Возвращает строковое представление пользователя, используя его имя.
@@ -88,3 +99,138 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
         :rtype: str
         """
         return self.username
+
+
+class TokenDevice(models.Model):
+    """
+    Устройство, с которого был выпущен refresh-токен (сессия пользователя).
+
+    Связано с `OutstandingToken` по `jti`, поэтому запись создаётся при логине без
+    дополнительного поиска id токена.
+
+    Атрибуты:
+        - `token` (OneToOneField): Выпущенный refresh-токен (по `jti`).
+        - `user_agent` (CharField): User-Agent клиента при логине.
+        - `ip_address` (GenericIPAddressField): IP-адрес клиента при логине.
+    """
+    token = models.OneToOneField(
+        'token_blacklist.OutstandingToken',
+        on_delete=models.CASCADE,
+        to_field='jti',
+        primary_key=True,
+        related_name='device',
+    )
+    user_agent = models.CharField(max_length=255, blank=True)
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+
+    def __str__(self):
+        """
+        Возвращает строковое представление устройства.
+
+        :return: User-Agent и IP-адрес.
+        :rtype: str
+        """
+        return f'{self.user_agent or "unknown"} ({self.ip_address or "-"})'
+
+
+class AuthEvent(models.Model):
+    """
+    Событие аутентификации для аудита и планирования нагрузки.
+
+    Записи создаются пакетами фоновым потоком (`custom_auth.events`), а не в запросе.
+    `user_id` хранится без внешнего ключа: журнал переживает удаление пользователя,
+    а пакетная вставка не проверяет ссылки.
+
+    Атрибуты:
+        - `event` (CharField): Тип события.
+        - `user_id` (UUIDField): Id пользователя, если он известен.
+        - `username` (CharField): Имя пользователя из запроса (в т.ч. для неудачного логина).
+        - `ip_address` (GenericIPAddressField): IP-адрес клиента.
+        - `user_agent` (CharField): User-Agent клиента.
+        - `created_at` (DateTimeField): Время события (а не время записи в БД).
+    """
+    LOGIN_SUCCESS = 'login_success'
+    LOGIN_FAILURE = 'login_failure'
+    REFRESH = 'refresh'
+    LOGOUT = 'logout'
+    REGISTER = 'register'
+    EVENT_CHOICES = [
+        (LOGIN_SUCCESS, 'Login success'),
+        (LOGIN_FAILURE, 'Login failure'),
+        (REFRESH, 'Token refresh'),
+        (LOGOUT, 'Logout'),
+        (REGISTER, 'Registration'),
+    ]
+
+    event = models.CharField(max_length=20, choices=EVENT_CHOICES)
+    user_id = models.UUIDField(null=True, blank=True, db_index=True)
+    username = models.CharField(max_length=150, blank=True)
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    user_agent = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        """
+        Возвращает строковое представление события.
+
+        :return: Тип события, пользователь и время.
+        :rtype: str
+        """
+        return f'{self.event} {self.username or self.user_id or "-"} at {self.created_at}'
+
+
+class OutboxMessage(models.Model):
+    """
+    Письмо в транзакционном outbox.
+
+    Запись создаётся в той же транзакции, что и изменение, которое её вызвало
+    (например, регистрация), а отправляет письмо отдельный процесс
+    (``manage.py send_outbox``). Так запрос не ждёт SMTP, а письмо не теряется и не
+    уходит, если транзакция откатилась.
+
+    Атрибуты:
+        - `kind` (CharField): Тип письма.
+        - `recipient` (EmailField): Адрес получателя.
+        - `subject` (CharField): Тема.
+        - `body` (TextField): Текст письма.
+        - `status` (CharField): Ожидает отправки, отправлено или отправка прекращена.
+        - `attempts` (PositiveIntegerField): Количество неудачных попыток.
+        - `available_at` (DateTimeField): Не раньше какого времени пробовать отправку.
+        - `last_error` (TextField): Ошибка последней попытки.
+        - `created_at` (DateTimeField): Время создания.
+        - `sent_at` (DateTimeField): Время отправки.
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    recipient = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # Воркер выбирает только ожидающие письма, отправленные в индекс не попадают
+        indexes = [
+            models.Index(fields=['available_at'], condition=models.Q(status='pending'), name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        """
+        Возвращает строковое представление письма.
+
+        :return: Тип, получатель и статус.
+        :rtype: str
+        """
+        return f'{self.kind} to {self.recipient} ({self.status})'
@@ -0,0 +1,173 @@
+"""
+Транзакционный outbox для писем.
+
+`enqueue_email` вызывается внутри транзакции, изменяющей данные (регистрация), и
+только добавляет строку `OutboxMessage`. `send_pending` вызывается воркером
+(``manage.py send_outbox``) и работает в три шага:
+
+    - в короткой транзакции выбирает пакет ожидающих писем через
+      ``SELECT ... FOR UPDATE SKIP LOCKED`` и сдвигает их `available_at` на срок
+      аренды `OUTBOX_LEASE` — другие воркеры эти письма не выбирают;
+    - отправляет письма через email backend Django вне транзакции, так что
+      блокировки строк не держатся на время обращений к SMTP;
+    - второй короткой транзакцией сохраняет результат — только для строк, аренда
+      которых всё ещё принадлежит этому воркеру (`available_at` не менялся).
+
+Воркеров можно запускать сколько угодно, и одно письмо не уходит дважды, пока
+пакет отправляется быстрее срока аренды; если пакет её пережил и письма уже забрал
+другой воркер, результат первого не сохраняется. Если воркер упадёт посреди пакета,
+неотправленные и отправленные, но не отмеченные письма будут выбраны снова после
+окончания аренды (доставка «как минимум один раз»).
+
+Неудачная отправка откладывает письмо с экспоненциальной задержкой
+(`OUTBOX_RETRY_BASE` * 2^(попытка - 1), не больше `OUTBOX_RETRY_MAX`), после
+`OUTBOX_MAX_ATTEMPTS` попыток письмо помечается как `failed`. Если не удалось
+подключиться к почтовому серверу, неудачной попыткой считается отправка всех
+писем пакета.
+"""
+import datetime
+import logging
+import random
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_email(kind, recipient, subject, body):
+    """
+    Ставит письмо в outbox. Вызывайте внутри транзакции, к которой письмо относится.
+
+    :param kind: Тип письма.
+    :type kind: str
+    :param recipient: Адрес получателя.
+    :type recipient: str
+    :param subject: Тема.
+    :type subject: str
+    :param body: Текст письма.
+    :type body: str
+    :return: Созданная запись.
+    :rtype: OutboxMessage
+    """
+    return OutboxMessage.objects.create(kind=kind, recipient=recipient, subject=subject, body=body)
+
+
+def retry_delay(attempts):
+    """
+    Возвращает задержку перед следующей попыткой с небольшим случайным разбросом.
+
+    :param attempts: Количество неудачных попыток, включая текущую.
+    :type attempts: int
+    :rtype: datetime.timedelta
+    """
+    base = getattr(settings, 'OUTBOX_RETRY_BASE', 30)
+    delay = min(base * 2 ** (attempts - 1), getattr(settings, 'OUTBOX_RETRY_MAX', 3600))
+    # Разброс не даёт письмам, упавшим вместе (например, при недоступном SMTP), повторяться разом
+    return datetime.timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim_pending(batch_size=50):
+    """
+    Забирает пакет ожидающих писем: в короткой транзакции выбирает их с
+    ``FOR UPDATE SKIP LOCKED`` и сдвигает `available_at` на срок аренды
+    (`OUTBOX_LEASE`), после чего другие воркеры их не выбирают.
+
+    :param batch_size: Максимальный размер пакета.
+    :type batch_size: int
+    :return: Забранные письма; их `available_at` равен концу аренды.
+    :rtype: list[OutboxMessage]
+    """
+    with transaction.atomic():
+        now = timezone.now()
+        messages = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxMessage.PENDING, available_at__lte=now)
+            .order_by('available_at')[:batch_size]
+        )
+        if messages:
+            lease_until = now + datetime.timedelta(seconds=getattr(settings, 'OUTBOX_LEASE', 300))
+            OutboxMessage.objects.filter(pk__in=[message.pk for message in messages]).update(
+                available_at=lease_until)
+            for message in messages:
+                message.available_at = lease_until
+    return messages
+
+
+def _record_failure(message, exc, max_attempts):
+    """
+    Учитывает неудачную попытку: откладывает письмо или помечает его как `failed`.
+    """
+    message.attempts += 1
+    message.last_error = f'{type(exc).__name__}: {exc}'
+    if message.attempts >= max_attempts:
+        message.status = OutboxMessage.FAILED
+        logger.error('Outbox message %s failed permanently', message.pk,
+                     extra={'outbox_id': message.pk, 'attempts': message.attempts})
+    else:
+        message.available_at = timezone.now() + retry_delay(message.attempts)
+        logger.warning('Outbox message %s failed, retrying', message.pk,
+                       extra={'outbox_id': message.pk, 'attempts': message.attempts})
+
+
+def send_pending(batch_size=50):
+    """
+    Отправляет один пакет ожидающих писем.
+
+    Письма забираются `claim_pending`, отправляются вне транзакции, а результат
+    сохраняется второй короткой транзакцией для писем, аренда которых не истекла.
+    Ошибка подключения к почтовому серверу считается неудачной попыткой для всех писем.
+
+    :param batch_size: Максимальный размер пакета.
+    :type batch_size: int
+    :return: Количество отправленных и неудачных писем.
+    :rtype: tuple[int, int]
+    """
+    messages = claim_pending(batch_size)
+    if not messages:
+        return 0, 0
+
+    lease_until = messages[0].available_at
+    max_attempts = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 8)
+    sent, failed = [], []
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as exc:
+        logger.warning('Outbox email connection failed', exc_info=True)
+        for message in messages:
+            _record_failure(message, exc, max_attempts)
+        failed = messages
+    else:
+        try:
+            for message in messages:
+                try:
+                    EmailMessage(
+                        message.subject, message.body, settings.DEFAULT_FROM_EMAIL, [message.recipient],
+                        connection=connection,
+                    ).send()
+                except Exception as exc:
+                    _record_failure(message, exc, max_attempts)
+                    failed.append(message)
+                else:
+                    sent.append(message.pk)
+        finally:
+            try:
+                connection.close()
+            except Exception:
+                logger.warning('Outbox email connection did not close cleanly', exc_info=True)
+
+    # Строки, аренда которых истекла, мог забрать другой воркер — их не трогаем
+    leased = OutboxMessage.objects.filter(status=OutboxMessage.PENDING, available_at=lease_until)
+    with transaction.atomic():
+        marked = leased.filter(pk__in=sent).update(status=OutboxMessage.SENT, sent_at=timezone.now()) if sent else 0
+        if failed:
+            marked += leased.bulk_update(failed, ['status', 'attempts', 'available_at', 'last_error'])
+    if marked < len(messages):
+        logger.warning('Outbox lease expired for %d messages before their result was saved',
+                       len(messages) - marked, extra={'lease': getattr(settings, 'OUTBOX_LEASE', 300)})
+    return len(sent), len(failed)
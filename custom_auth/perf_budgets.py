@@ -0,0 +1,55 @@
+"""
+Бюджеты производительности эндпоинтов `custom_auth` для тестов.
+
+Для каждого имени URL и HTTP-метода в `PERFORMANCE_BUDGETS` задаётся максимальное
+число SQL-запросов, вызовов хеширования пароля и пиковый объём памяти,
+выделенной во время запроса (tracemalloc). Проверяет их
+`custom_auth.tests_utils.PerformanceBudgetMixin`.
+"""
+from collections import namedtuple
+
+# queries — SQL-запросов, hashes — вызовов encode/verify хешера, alloc_kb — пик выделенной памяти в КБ
+Budget = namedtuple('Budget', ['queries', 'hashes', 'alloc_kb'])
+
+PERFORMANCE_BUDGETS = {
+    'register': {
+        # проверки уникальности username/email + INSERT
+        'POST': Budget(queries=3, hashes=1, alloc_kb=384),
+    },
+    'confirm_email': {
+        # подпись токена проверяется без БД, активация — один UPDATE
+        'POST': Budget(queries=1, hashes=0, alloc_kb=96),
+    },
+    'availability': {
+        # точно свободные значения отвечаются по фильтру Блума без БД,
+        # возможные совпадения проверяются одним запросом
+        'GET': Budget(queries=1, hashes=0, alloc_kb=64),
+    },
+    'login': {
+        # пользователь + OutstandingToken + claims (холодный кэш) + TokenDevice
+        'POST': Budget(queries=4, hashes=1, alloc_kb=512),
+    },
+    'logout': {
+        'POST': Budget(queries=5, hashes=0, alloc_kb=128),
+    },
+    'token_refresh': {
+        # пользователь из access-cookie + проверка blacklist
+        'POST': Budget(queries=2, hashes=0, alloc_kb=128),
+    },
+    'user_profile': {
+        'GET': Budget(queries=1, hashes=0, alloc_kb=96),
+        'PATCH': Budget(queries=4, hashes=1, alloc_kb=128),
+    },
+    'sessions': {
+        # пользователь из access-cookie + список сессий
+        'GET': Budget(queries=2, hashes=0, alloc_kb=128),
+    },
+    'session_revoke': {
+        # пользователь + INSERT ... SELECT
+        'POST': Budget(queries=2, hashes=0, alloc_kb=96),
+    },
+    'sessions_revoke_all': {
+        # пользователь + INSERT ... SELECT независимо от числа токенов
+        'POST': Budget(queries=2, hashes=0, alloc_kb=96),
+    },
+}
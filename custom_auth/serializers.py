@@ -1,5 +1,9 @@
+from django.conf import settings
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from .claims import add_claims, get_user_claims
 from .models import CustomUser
+from .tokens import RefreshToken
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -20,6 +24,9 @@ class RegisterSerializer(serializers.ModelSerializer):
         """
         Создаёт нового пользователя с хешированным паролем.
 
+        При `EMAIL_CONFIRMATION_REQUIRED` пользователь создаётся неактивным до
+        подтверждения почты (`custom_auth.confirmation`).
+
         :param validated_data: Валидированные данные для создания пользователя.
         :type validated_data: dict
         :return: Созданный экземпляр пользователя.
@@ -29,8 +36,7 @@ class RegisterSerializer(serializers.ModelSerializer):
             username=validated_data['username'],
             email=validated_data['email'],
             password=validated_data['password'],
-            # по умолчанию активный пользователь (сделать подтверждение в почте)
-            is_active=True
+            is_active=not getattr(settings, 'EMAIL_CONFIRMATION_REQUIRED', False),
         )
         return user
 
@@ -99,3 +105,25 @@ class UserProfileUpdateSerializer(serializers.ModelSerializer):
 
         instance.save()
         return instance
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Сериализатор логина, добавляющий в токены claims роли и прав пользователя.
+
+    Claims записываются в refresh-токен и копируются в выпущенный из него access-токен.
+    Токены выпускаются классами `custom_auth.tokens` (компактный формат при `COMPACT_TOKENS`).
+    """
+    token_class = RefreshToken
+
+    @classmethod
+    def get_token(cls, user):
+        """
+        Создаёт refresh-токен с claims `role` и `perms`.
+
+        :param user: Аутентифицированный пользователь.
+        :type user: CustomUser
+        :return: Refresh-токен.
+        :rtype: custom_auth.tokens.RefreshToken
+        """
+        return add_claims(super().get_token(user), get_user_claims(user))
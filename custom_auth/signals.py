@@ -0,0 +1,84 @@
+"""
+Инвалидация кэша claims (`custom_auth.claims`) при изменении ролей, групп и прав
+и пополнение фильтра занятых имён и адресов (`custom_auth.availability`).
+"""
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import availability, claims
+from .models import CustomUser
+
+
+@receiver(m2m_changed, sender=CustomUser.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Членство в группах изменилось: сбрасываем claims затронутых пользователей.
+
+    При ``clear`` со стороны группы `pk_set` пуст, поэтому участников группы
+    выбираем до очистки (``pre_clear``).
+    """
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            claims.invalidate_users([instance.pk])
+    elif action == 'pre_clear':
+        claims.invalidate_users(instance.user_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        claims.invalidate_users(pk_set)
+
+
+@receiver(m2m_changed, sender=CustomUser.user_permissions.through)
+def user_permissions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Личные права пользователя изменились.
+    """
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            claims.invalidate_users([instance.pk])
+    elif action == 'pre_clear':
+        claims.invalidate_users(instance.user_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        claims.invalidate_users(pk_set)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Права группы изменились: увеличиваем версию группы.
+
+    Claims пользователей хранят только id групп, поэтому их сбрасывать не нужно.
+    """
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            claims.invalidate_groups([instance.pk])
+    elif action == 'pre_clear':
+        claims.invalidate_groups(instance.group_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        claims.invalidate_groups(pk_set)
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    claims.invalidate_groups([instance.pk])
+
+
+@receiver(post_save, sender=CustomUser)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Роль зависит от `is_staff`, права — от `is_superuser` и `is_active`.
+    """
+    if created:
+        return
+    if update_fields is not None and not {'is_staff', 'is_superuser', 'is_active'} & set(update_fields):
+        return
+    claims.invalidate_users([instance.pk])
+
+
+@receiver(post_save, sender=CustomUser)
+def user_identity_saved(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Новые имя и почта (регистрация, смена почты в профиле) становятся занятыми.
+    """
+    if not created and update_fields is not None and not {'username', 'email'} & set(update_fields):
+        return
+    availability.index.add_user(instance.username, instance.email)
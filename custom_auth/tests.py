@@ -1,8 +1,36 @@
+import datetime
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.test import TestCase
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
 from django.contrib.auth import get_user_model
-from django.contrib.auth.models import Group
+from django.contrib.auth.models import Group, Permission
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.state import token_backend
+
+from . import admission, availability, events, outbox, tokens
+from .admin import CustomUserAdmin
+from .claims import get_user_claims
+from .confirmation import make_confirmation_token
+from .models import AuthEvent, OutboxMessage
+from .benchmark import BENCHMARK_PASSWORD, Sample, compare, percentile, seed_users, summarize
+from .perf_budgets import PERFORMANCE_BUDGETS, Budget
+from .tests_utils import PerformanceBudgetMixin
+from .urls import urlpatterns
 
 CustomUser = get_user_model()
 
@@ -78,3 +106,720 @@ class AuthTests(APITestCase):
         self.client.credentials(HTTP_AUTHORIZATION='Bearer invalidtoken')
         response = self.client.get(protected_url)
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class BenchmarkHelpersTests(TestCase):
+
+    def test_seed_users_uses_single_password_hash(self):
+        users = seed_users(5)
+        self.assertEqual(CustomUser.objects.count(), 5)
+        self.assertEqual(len({user.password for user in users}), 1)
+        self.assertTrue(CustomUser.objects.get(username='bench0').check_password(BENCHMARK_PASSWORD))
+
+    def test_percentile_nearest_rank(self):
+        values = [float(i) for i in range(1, 101)]
+        self.assertEqual(percentile(values, 50), 50.0)
+        self.assertEqual(percentile(values, 99), 99.0)
+        self.assertEqual(percentile([7.0], 95), 7.0)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_summary_excludes_unexpected_statuses_from_latency_and_rps(self):
+        samples = [Sample(0.4, 200, 4), Sample(0.6, 200, 4), Sample(0.0002, 503, 0), Sample(0.0003, 503, 0)]
+        summary = summarize(samples, 2.0, {200})
+        self.assertEqual((summary['requests'], summary['errors'], summary['rps']), (4, 2, 1.0))
+        self.assertEqual(summary['error_statuses'], {'503': 2})
+        self.assertEqual((summary['latency_ms']['p50'], summary['queries_per_request']), (400.0, 4.0))
+        self.assertIn('errors 0 -> 2 (not comparable)', compare({'login': summarize(samples[:2], 2.0, {200})},
+                                                                  {'login': summary})[0])
+
+
+class PerformanceBudgetTests(PerformanceBudgetMixin, APITestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='testuser',
+            email='testuser@example.com',
+            password='testpassword123'
+        )
+        refresh = RefreshToken.for_user(self.user)
+        self.client.cookies['access_token'] = str(refresh.access_token)
+        self.client.cookies['refresh_token'] = str(refresh)
+        # Устойчивое состояние: claims пользователя закэшированы при логине
+        cache.clear()
+        get_user_claims(self.user)
+
+    def test_every_url_has_a_budget(self):
+        url_names = {pattern.name for pattern in urlpatterns}
+        self.assertEqual(url_names - set(PERFORMANCE_BUDGETS), set())
+
+    def test_budget_failure_reports_exceeded_metric_and_delta(self):
+        budgets = {'user_profile': {'GET': Budget(queries=0, hashes=0, alloc_kb=10 ** 6)}}
+        with mock.patch.object(self, 'budgets', budgets), self.assertRaises(AssertionError) as failure:
+            with self.assertWithinBudget('user_profile', 'GET'):
+                self.client.get(reverse('custom_auth:user_profile'))
+        message = str(failure.exception)
+        self.assertIn('SQL queries: 1, budget 0 (+1)', message)
+        self.assertNotIn('peak allocation', message)
+        self.assertIn('Executed queries (1)', message)
+
+    def test_register_budget(self):
+        data = {'username': 'newuser', 'email': 'newuser@example.com', 'password': 'testpassword123'}
+        self.client.cookies.clear()
+        with self.assertWithinBudget('register', 'POST'):
+            response = self.client.post(reverse('custom_auth:register'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_availability_budget(self):
+        self.client.cookies.clear()
+        url = reverse('custom_auth:availability')
+        with mock.patch.object(availability, 'index', availability.AvailabilityIndex()) as index:
+            index.load()
+            with self.assertWithinBudget('availability', 'GET'):
+                response = self.client.get(url, {'username': 'testuser', 'email': 'testuser@example.com'})
+        self.assertEqual(response.json(), {'username': False, 'email': False})
+
+    def test_confirm_email_budget(self):
+        self.client.cookies.clear()
+        token = make_confirmation_token(self.user)
+        with self.assertWithinBudget('confirm_email', 'POST'):
+            response = self.client.post(reverse('custom_auth:confirm_email'), {'token': token}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_login_budget(self):
+        data = {'username': 'testuser', 'password': 'testpassword123'}
+        self.client.cookies.clear()
+        cache.clear()
+        with self.assertWithinBudget('login', 'POST'):
+            response = self.client.post(reverse('custom_auth:login'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_logout_budget(self):
+        with self.assertWithinBudget('logout', 'POST'):
+            response = self.client.post(reverse('custom_auth:logout'))
+        self.assertEqual(response.status_code, status.HTTP_205_RESET_CONTENT)
+
+    def test_token_refresh_budget(self):
+        with self.assertWithinBudget('token_refresh', 'POST'):
+            response = self.client.post(reverse('custom_auth:token_refresh'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_user_profile_get_budget(self):
+        with self.assertWithinBudget('user_profile', 'GET'):
+            response = self.client.get(reverse('custom_auth:user_profile'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_user_profile_patch_budget(self):
+        data = {'email': 'changed@example.com', 'password': 'newpassword456'}
+        with self.assertWithinBudget('user_profile', 'PATCH'):
+            response = self.client.patch(reverse('custom_auth:user_profile'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_sessions_get_budget(self):
+        with self.assertWithinBudget('sessions', 'GET'):
+            response = self.client.get(reverse('custom_auth:sessions'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_session_revoke_budget(self):
+        jti = RefreshToken.for_user(self.user)['jti']
+        with self.assertWithinBudget('session_revoke', 'POST'):
+            response = self.client.post(reverse('custom_auth:session_revoke', args=[jti]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_sessions_revoke_all_budget(self):
+        for _ in range(50):
+            RefreshToken.for_user(self.user)
+        with self.assertWithinBudget('sessions_revoke_all', 'POST'):
+            response = self.client.post(reverse('custom_auth:sessions_revoke_all'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['revoked'], 51)
+
+
+class SessionRegistryTests(APITestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='testuser',
+            email='testuser@example.com',
+            password='testpassword123'
+        )
+        data = {'username': 'testuser', 'password': 'testpassword123'}
+        self.client.post(reverse('custom_auth:login'), data, format='json', HTTP_USER_AGENT='Phone')
+        self.phone_cookies = {name: morsel.value for name, morsel in self.client.cookies.items()}
+        self.client.post(reverse('custom_auth:login'), data, format='json', HTTP_USER_AGENT='Laptop')
+
+    def test_list_marks_current_session_and_device(self):
+        response = self.client.get(reverse('custom_auth:sessions'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        sessions = response.json()
+        self.assertEqual([session['user_agent'] for session in sessions], ['Laptop', 'Phone'])
+        self.assertEqual([session['current'] for session in sessions], [True, False])
+
+    def test_revoke_single_session(self):
+        phone_jti = RefreshToken(self.phone_cookies['refresh_token'])['jti']
+        response = self.client.post(reverse('custom_auth:session_revoke', args=[phone_jti]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        sessions = self.client.get(reverse('custom_auth:sessions')).json()
+        self.assertEqual([session['user_agent'] for session in sessions], ['Laptop'])
+        # Повторный отзыв и чужой jti — 404
+        response = self.client.post(reverse('custom_auth:session_revoke', args=[phone_jti]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        other = CustomUser.objects.create_user(username='other', email='other@example.com', password='x')
+        other_jti = RefreshToken.for_user(other)['jti']
+        response = self.client.post(reverse('custom_auth:session_revoke', args=[other_jti]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_revoke_all_uses_one_statement_and_blocks_refresh(self):
+        for _ in range(20):
+            RefreshToken.for_user(self.user)
+        url = reverse('custom_auth:sessions_revoke_all')
+        self.client.force_authenticate(self.user)
+        with self.assertNumQueries(1):
+            response = self.client.post(url)
+        self.assertEqual(response.json()['revoked'], 22)
+        self.assertEqual(BlacklistedToken.objects.filter(token__user=self.user).count(), 22)
+        self.client.force_authenticate(None)
+
+        self.client.cookies.clear()
+        self.client.cookies['refresh_token'] = self.phone_cookies['refresh_token']
+        response = self.client.post(reverse('custom_auth:token_refresh'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_logout_without_cookie(self):
+        self.client.cookies.clear()
+        response = self.client.post(reverse('custom_auth:logout'))
+        self.assertEqual(response.status_code, status.HTTP_205_RESET_CONTENT)
+
+
+class AuthEventTests(APITestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='testuser',
+            email='testuser@example.com',
+            password='testpassword123'
+        )
+        self.recorder = events.AuthEventRecorder(events.MemorySink(), autostart=False)
+        patcher = mock.patch.object(events, '_recorder', self.recorder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def recorded(self):
+        self.recorder.flush()
+        return [(event['event'], event['username']) for event in self.recorder.sink.events]
+
+    def test_auth_flow_records_events(self):
+        login_url = reverse('custom_auth:login')
+        self.client.post(login_url, {'username': 'testuser', 'password': 'wrong'}, format='json')
+        self.client.post(reverse('custom_auth:register'),
+                         {'username': 'newuser', 'email': 'newuser@example.com', 'password': 'testpassword123'},
+                         format='json')
+        self.client.post(login_url, {'username': 'testuser', 'password': 'testpassword123'}, format='json')
+        self.client.post(reverse('custom_auth:token_refresh'))
+        self.client.post(reverse('custom_auth:logout'))
+        self.assertEqual(self.recorded(), [
+            (AuthEvent.LOGIN_FAILURE, 'testuser'),
+            (AuthEvent.REGISTER, 'newuser'),
+            (AuthEvent.LOGIN_SUCCESS, 'testuser'),
+            (AuthEvent.REFRESH, ''),
+            (AuthEvent.LOGOUT, ''),
+        ])
+        self.assertEqual({event['user_id'] for event in self.recorder.sink.events[2:]}, {str(self.user.pk)})
+
+    def test_database_sink_writes_in_batches(self):
+        recorder = events.AuthEventRecorder(events.DatabaseSink(), batch_size=2, autostart=False)
+        request = mock.Mock(META={'REMOTE_ADDR': '10.0.0.1', 'HTTP_USER_AGENT': 'Phone'})
+        with mock.patch.object(events, '_recorder', recorder):
+            for _ in range(5):
+                events.record_event(AuthEvent.LOGIN_SUCCESS, request, self.user)
+        with mock.patch.object(events, 'close_old_connections'), self.assertNumQueries(3):
+            recorder.flush()
+        self.assertEqual(AuthEvent.objects.filter(user_id=self.user.pk, ip_address='10.0.0.1').count(), 5)
+        self.assertEqual(recorder.stats()['flushes'], 3)
+
+    def test_flusher_thread_logs_stats(self):
+        recorder = events.AuthEventRecorder(events.MemorySink(), flush_interval=0.01, stats_interval=0.01)
+        with self.assertLogs('custom_auth.events', 'INFO') as logs:
+            recorder.record({'event': AuthEvent.LOGIN_SUCCESS, 'username': 'testuser'})
+            recorder.close()
+        records = [record for record in logs.records if record.levelname == 'INFO']
+        self.assertEqual(len(records), 1)
+        self.assertEqual((records[0].written, records[0].dropped, records[0].queue_depth), (1, 0, 0))
+        self.assertIsNotNone(records[0].max_flush_ms)
+
+    def test_jsonl_sink_appends_lines(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'events.jsonl')
+            sink = events.JSONLFileSink(path)
+            sink.write([{'event': AuthEvent.LOGOUT, 'user_id': None}])
+            sink.write([{'event': AuthEvent.REFRESH, 'user_id': None}])
+            with open(path) as fh:
+                self.assertEqual([json.loads(line)['event'] for line in fh], [AuthEvent.LOGOUT, AuthEvent.REFRESH])
+
+    def test_background_flush_by_size_and_time(self):
+        recorder = events.AuthEventRecorder(events.MemorySink(), batch_size=2, flush_interval=0.05)
+        self.addCleanup(recorder.close)
+        for number in range(3):
+            recorder.record({'event': AuthEvent.REFRESH, 'number': number})
+        deadline = time.monotonic() + 5
+        while len(recorder.sink.events) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([event['number'] for event in recorder.sink.events], [0, 1, 2])
+        stats = recorder.stats()
+        self.assertEqual((stats['queue_depth'], stats['written'], stats['flushes']), (0, 3, 2))
+        self.assertIsNotNone(stats['last_flush_ms'])
+
+    def test_full_queue_drops_without_blocking(self):
+        recorder = events.AuthEventRecorder(events.MemorySink(), maxsize=2, autostart=False)
+        results = [recorder.record({'event': AuthEvent.REFRESH}) for _ in range(3)]
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual((recorder.stats()['queue_depth'], recorder.stats()['dropped']), (2, 1))
+
+        blocking = events.AuthEventRecorder(events.MemorySink(), maxsize=1, overflow='block',
+                                            block_timeout=0.01, autostart=False)
+        blocking.record({'event': AuthEvent.REFRESH})
+        self.assertFalse(blocking.record({'event': AuthEvent.REFRESH}))
+        self.assertEqual(blocking.dropped, 1)
+
+
+class CompactTokenTests(APITestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='testuser',
+            email='testuser@example.com',
+            password='testpassword123'
+        )
+
+    @override_settings(COMPACT_TOKENS=True)
+    def test_compact_tokens_are_shorter_and_round_trip(self):
+        legacy = RefreshToken.for_user(self.user)
+        compact = tokens.RefreshToken.for_user(self.user)
+        raw = token_backend.decode(str(compact))
+        self.assertEqual(set(raw), {'t', 'j', 'u', 'exp', 'iat'})
+        self.assertEqual((raw['t'], len(raw['j']), len(raw['u'])), ('r', 16, 22))
+        self.assertLess(len(str(compact)), len(str(legacy)) - 60)
+        self.assertLess(len(str(compact.access_token)), len(str(legacy.access_token)) - 60)
+
+        decoded = tokens.RefreshToken(str(compact))
+        self.assertEqual(decoded['user_id'], str(self.user.pk))
+        self.assertEqual(decoded['token_type'], 'refresh')
+
+    def test_both_formats_verify_during_rollout(self):
+        with override_settings(COMPACT_TOKENS=True):
+            data = {'username': 'testuser', 'password': 'testpassword123'}
+            response = self.client.post(reverse('custom_auth:login'), data, format='json')
+            self.assertEqual(token_backend.decode(response.cookies['access_token'].value)['r'], 'user')
+            compact_refresh = response.cookies['refresh_token'].value
+        # Сервис откатили на обычный формат: выпущенные компактные токены продолжают работать
+        self.client.cookies['refresh_token'] = compact_refresh
+        response = self.client.post(reverse('custom_auth:token_refresh'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        profile = self.client.get(reverse('custom_auth:user_profile'))
+        self.assertEqual(profile.json()['role'], 'user')
+        # И наоборот: обычные токены проверяются при включённом компактном формате
+        with override_settings(COMPACT_TOKENS=True):
+            self.client.cookies['access_token'] = str(RefreshToken.for_user(self.user).access_token)
+            self.assertEqual(self.client.get(reverse('custom_auth:user_profile')).status_code, status.HTTP_200_OK)
+
+    @override_settings(COMPACT_TOKENS=True)
+    def test_compact_refresh_token_is_blacklisted_on_logout(self):
+        data = {'username': 'testuser', 'password': 'testpassword123'}
+        refresh = self.client.post(reverse('custom_auth:login'), data, format='json').cookies['refresh_token'].value
+        self.client.post(reverse('custom_auth:logout'))
+        self.client.cookies['refresh_token'] = refresh
+        response = self.client.post(reverse('custom_auth:token_refresh'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_refresh_cookie_is_path_scoped(self):
+        data = {'username': 'testuser', 'password': 'testpassword123'}
+        response = self.client.post(reverse('custom_auth:login'), data, format='json')
+        self.assertEqual(response.cookies['refresh_token']['path'], '/auth/')
+        self.assertEqual(response.cookies['access_token']['path'], '/')
+        for url_name in ('token_refresh', 'logout', 'sessions'):
+            self.assertTrue(reverse(f'custom_auth:{url_name}').startswith('/auth/'))
+
+    def test_path_scoped_refresh_cookie_wins_over_legacy_root_cookie(self):
+        data = {'username': 'testuser', 'password': 'testpassword123'}
+        refresh = self.client.post(reverse('custom_auth:login'), data, format='json').cookies['refresh_token'].value
+        legacy = RefreshToken.for_user(CustomUser.objects.get(username='testuser'))
+        legacy.blacklist()
+        # Браузер отправляет cookie с более длинным путём первой
+        response = self.client.post(reverse('custom_auth:token_refresh'),
+                                    HTTP_COOKIE=f'refresh_token={refresh}; refresh_token={legacy}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+    def test_logout_revokes_legacy_root_refresh_cookie(self):
+        data = {'username': 'testuser', 'password': 'testpassword123'}
+        refresh = self.client.post(reverse('custom_auth:login'), data, format='json').cookies['refresh_token'].value
+        legacy = RefreshToken.for_user(CustomUser.objects.get(username='testuser'))
+        self.client.cookies.clear()
+        response = self.client.post(reverse('custom_auth:logout'),
+                                    HTTP_COOKIE=f'refresh_token={refresh}; refresh_token={legacy}')
+        self.assertEqual(response.status_code, status.HTTP_205_RESET_CONTENT)
+        # Старая cookie на / удаляется отдельным заголовком
+        legacy_cookie = response.headers['Set-Cookie']
+        self.assertTrue(legacy_cookie.startswith('refresh_token=""'))
+        self.assertIn('Max-Age=0; Path=/;', legacy_cookie)
+        self.assertEqual(response.cookies['refresh_token']['path'], '/auth/')
+        for token in (refresh, legacy):
+            response = self.client.post(reverse('custom_auth:token_refresh'), HTTP_COOKIE=f'refresh_token={token}')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class AdmissionControlTests(APITestCase):
+
+    def test_gate_rejects_beyond_limit_and_queue(self):
+        gate = admission.AdmissionGate(limit=1, queue_size=0)
+        self.assertTrue(gate.acquire())
+        self.assertFalse(gate.acquire())
+        gate.release()
+        self.assertTrue(gate.acquire())
+        self.assertEqual(gate.rejected, 1)
+
+    def test_queued_request_is_admitted_when_slot_frees(self):
+        gate = admission.AdmissionGate(limit=1, queue_size=1, wait_timeout=5)
+        self.assertTrue(gate.acquire())
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(gate.acquire()))
+        waiter.start()
+        while not gate.waiting:
+            time.sleep(0.001)
+        # Очередь занята — следующий запрос отклоняется сразу, без ожидания
+        started = time.monotonic()
+        self.assertFalse(gate.acquire())
+        self.assertLess(time.monotonic() - started, 1)
+        gate.release()
+        waiter.join()
+        self.assertEqual(results, [True])
+
+    def test_shared_counter_limits_across_processes(self):
+        counter = admission.SharedInFlightCounter(limit=1, slots=4)
+        self.assertTrue(counter.try_acquire())
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0 if not counter.try_acquire() else 1)
+        _, exit_status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(exit_status), 0)
+        counter.release()
+        self.assertEqual(counter.in_flight(), 0)
+
+        counter.try_acquire()
+        counter.release_process(os.getpid())
+        self.assertEqual(counter.in_flight(), 0)
+
+    def test_overloaded_login_gets_503_and_cheap_endpoints_still_work(self):
+        user = CustomUser.objects.create_user(username='testuser', email='testuser@example.com',
+                                              password='testpassword123')
+        gate = admission.AdmissionGate(limit=1, queue_size=0)
+        gate.acquire()  # все места заняты
+        with mock.patch.object(admission, 'hashing_gate', gate):
+            for url_name in ('login', 'register'):
+                response = self.client.post(reverse(f'custom_auth:{url_name}'), {}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+                self.assertEqual(response['Retry-After'], '1')
+            self.client.cookies['access_token'] = str(RefreshToken.for_user(user).access_token)
+            self.assertEqual(self.client.get(reverse('custom_auth:user_profile')).status_code, status.HTTP_200_OK)
+
+
+@override_settings(EMAIL_CONFIRMATION_REQUIRED=True,
+                   EMAIL_CONFIRMATION_URL='https://drunar.space/confirm-email/{token}')
+class OutboxTests(APITestCase):
+
+    def register(self, username='newuser'):
+        data = {'username': username, 'email': f'{username}@example.com', 'password': 'testpassword123'}
+        response = self.client.post(reverse('custom_auth:register'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return CustomUser.objects.get(username=username)
+
+    def test_registration_enqueues_email_instead_of_sending(self):
+        user = self.register()
+        self.assertFalse(user.is_active)
+        self.assertEqual(len(mail.outbox), 0)
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.recipient, message.status), (user.email, OutboxMessage.PENDING))
+
+    def test_worker_sends_each_message_once(self):
+        self.register('first')
+        self.register('second')
+        self.assertEqual(outbox.send_pending(batch_size=10), (2, 0))
+        self.assertEqual(outbox.send_pending(batch_size=10), (0, 0))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['first@example.com', 'second@example.com'])
+        self.assertFalse(OutboxMessage.objects.exclude(status=OutboxMessage.SENT).exists())
+
+    def test_claimed_messages_are_hidden_from_other_workers_while_sending(self):
+        self.register()
+        concurrent = []
+
+        def send(message):
+            # Второй воркер запускается, пока первый отправляет письмо
+            concurrent.append(outbox.send_pending())
+
+        with mock.patch('django.core.mail.EmailMessage.send', autospec=True, side_effect=send):
+            self.assertEqual(outbox.send_pending(), (1, 0))
+        self.assertEqual(concurrent, [(0, 0)])
+        self.assertEqual(OutboxMessage.objects.get().status, OutboxMessage.SENT)
+
+    def test_command_drains_outbox_once(self):
+        self.register('first')
+        self.register('second')
+        stdout = io.StringIO()
+        call_command('send_outbox', '--once', '--batch-size', '1', stdout=stdout)
+        self.assertIn('Done: sent 2, failed 0.', stdout.getvalue())
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_failed_send_is_retried_with_backoff_then_given_up(self):
+        self.register()
+        with override_settings(OUTBOX_MAX_ATTEMPTS=2), \
+                mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('connection refused')):
+            self.assertEqual(outbox.send_pending(), (0, 1))
+            message = OutboxMessage.objects.get()
+            self.assertEqual((message.status, message.attempts), (OutboxMessage.PENDING, 1))
+            self.assertIn('connection refused', message.last_error)
+            # До истечения задержки письмо не выбирается
+            self.assertEqual(outbox.send_pending(), (0, 0))
+            OutboxMessage.objects.update(available_at=message.created_at)
+            self.assertEqual(outbox.send_pending(), (0, 1))
+        self.assertEqual(OutboxMessage.objects.get().status, OutboxMessage.FAILED)
+
+    def test_unreachable_mail_server_counts_as_failed_attempt(self):
+        self.register()
+        self.register('second')
+        connection = mock.Mock(**{'open.side_effect': ConnectionRefusedError('connection refused')})
+        with mock.patch.object(outbox, 'get_connection', return_value=connection):
+            self.assertEqual(outbox.send_pending(), (0, 2))
+            stdout = io.StringIO()
+            OutboxMessage.objects.update(available_at=OutboxMessage.objects.first().created_at)
+            call_command('send_outbox', '--once', stdout=stdout)
+        self.assertIn('Done: sent 0, failed 2.', stdout.getvalue())
+        for message in OutboxMessage.objects.all():
+            self.assertEqual((message.status, message.attempts), (OutboxMessage.PENDING, 2))
+            self.assertIn('ConnectionRefusedError', message.last_error)
+            self.assertGreater(message.available_at, message.created_at)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_result_is_not_saved_after_lease_expired(self):
+        self.register()
+
+        def lease_taken_over(message):
+            # Пакет пережил аренду: письмо забрал другой воркер и продлил аренду
+            OutboxMessage.objects.update(available_at=timezone.now() + datetime.timedelta(hours=1))
+
+        with mock.patch('django.core.mail.EmailMessage.send', autospec=True, side_effect=lease_taken_over), \
+                self.assertLogs('custom_auth.outbox', 'WARNING') as logs:
+            self.assertEqual(outbox.send_pending(), (1, 0))
+        self.assertEqual(OutboxMessage.objects.get().status, OutboxMessage.PENDING)
+        self.assertIn('lease expired for 1 messages', logs.output[-1])
+
+        def sent_by_other_worker(message):
+            OutboxMessage.objects.update(status=OutboxMessage.SENT)
+            raise OSError('timeout')
+
+        OutboxMessage.objects.update(available_at=timezone.now())
+        with mock.patch('django.core.mail.EmailMessage.send', autospec=True, side_effect=sent_by_other_worker), \
+                self.assertLogs('custom_auth.outbox', 'WARNING'):
+            self.assertEqual(outbox.send_pending(), (0, 1))
+        # Неудача первого воркера не возвращает отправленное письмо в очередь
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.status, message.attempts), (OutboxMessage.SENT, 0))
+
+    def test_retry_delay_grows_exponentially_up_to_cap(self):
+        with override_settings(OUTBOX_RETRY_BASE=10, OUTBOX_RETRY_MAX=60), \
+                mock.patch('random.uniform', return_value=1):
+            delays = [outbox.retry_delay(attempt).total_seconds() for attempt in (1, 2, 3, 4, 5)]
+        self.assertEqual(delays, [10, 20, 40, 60, 60])
+
+    def test_confirmation_link_activates_user_once(self):
+        self.register()
+        outbox.send_pending()
+        token = mail.outbox[0].body.split('/confirm-email/')[1].strip()
+        url = reverse('custom_auth:confirm_email')
+
+        with self.assertNumQueries(1):
+            response = self.client.post(url, {'token': token}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        user = CustomUser.objects.get(username='newuser')
+        self.assertTrue(user.is_active)
+        self.assertIsNotNone(user.email_confirmed_at)
+
+        response = self.client.post(url, {'token': token}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tampered_or_expired_token_is_rejected_without_db(self):
+        token = make_confirmation_token(self.register())
+        url = reverse('custom_auth:confirm_email')
+        with self.assertNumQueries(0):
+            response = self.client.post(url, {'token': token[:-1] + ('A' if token[-1] != 'A' else 'B')},
+                                        format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with override_settings(EMAIL_CONFIRMATION_MAX_AGE=-1), self.assertNumQueries(0):
+            response = self.client.post(url, {'token': token}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AvailabilityTests(APITestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='TakenUser', email='taken@Example.com',
+                                                   password='testpassword123')
+        patcher = mock.patch.object(availability, 'index', availability.AvailabilityIndex())
+        self.index = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.index.load()
+        self.url = reverse('custom_auth:availability')
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = availability.BloomFilter(1000, error_rate=0.01)
+        for number in range(1000):
+            bloom.add(f'user{number}')
+        self.assertTrue(all(f'user{number}' in bloom for number in range(1000)))
+        false_positives = sum(f'other{number}' in bloom for number in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_definite_negative_is_answered_without_db(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {'username': 'freshname', 'email': 'fresh@example.com'})
+        self.assertEqual(response.json(), {'username': True, 'email': True})
+
+    def test_possible_hit_falls_through_to_exact_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'username': 'TakenUser', 'email': 'taken@EXAMPLE.COM'})
+        self.assertEqual(response.json(), {'username': False, 'email': False})
+        # Пробелы по краям обрезаются, как при регистрации
+        response = self.client.get(self.url, {'username': ' TakenUser ', 'email': ' taken@example.com'})
+        self.assertEqual(response.json(), {'username': False, 'email': False})
+        # Другой регистр имени — возможное совпадение по фильтру, но имя свободно
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'username': 'takenuser'})
+        self.assertEqual(response.json(), {'username': True})
+
+    def test_filter_follows_registration_and_email_change(self):
+        data = {'username': 'newuser', 'email': 'newuser@example.com', 'password': 'testpassword123'}
+        self.client.post(reverse('custom_auth:register'), data, format='json')
+        self.assertTrue(self.index.might_contain(availability.USERNAME, 'newuser'))
+
+        self.client.cookies['access_token'] = str(RefreshToken.for_user(self.user).access_token)
+        self.client.patch(reverse('custom_auth:user_profile'), {'email': 'moved@example.com'}, format='json')
+        self.assertTrue(self.index.might_contain(availability.EMAIL, 'moved@example.com'))
+        response = self.client.get(self.url, {'email': 'moved@example.com'})
+        self.assertEqual(response.json(), {'email': False})
+
+    def test_stale_filter_is_rebuilt_in_background(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(email='renamed@example.com')
+        with override_settings(AVAILABILITY_REBUILD_INTERVAL=0), \
+                mock.patch('custom_auth.availability.threading.Thread') as thread:
+            self.index.might_contain(availability.EMAIL, 'renamed@example.com')
+        thread.return_value.start.assert_called_once_with()
+        # Перестройка в потоке читает ту же БД; в тесте выполняем её синхронно
+        self.index.load()
+        self.assertTrue(self.index.might_contain(availability.EMAIL, 'renamed@example.com'))
+
+    def test_missing_parameters(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TokenClaimsTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            username='testuser',
+            email='testuser@example.com',
+            password='testpassword123'
+        )
+        self.group = Group.objects.create(name='editors')
+        self.group.permissions.add(Permission.objects.get(codename='change_group'))
+
+    def login_claims(self):
+        url = reverse('custom_auth:login')
+        response = self.client.post(url, {'username': 'testuser', 'password': 'testpassword123'}, format='json')
+        return AccessToken(response.cookies['access_token'].value)
+
+    def test_login_token_carries_role_and_permissions(self):
+        self.user.groups.add(self.group)
+        self.user.user_permissions.add(Permission.objects.get(codename='view_group'))
+        token = self.login_claims()
+        self.assertEqual(token['role'], 'user')
+        self.assertEqual(token['perms'], ['auth.change_group', 'auth.view_group'])
+
+    def test_claims_resolved_in_one_query_then_cached(self):
+        with self.assertNumQueries(1):
+            claims = get_user_claims(self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user_claims(self.user), claims)
+
+    def test_claims_of_user_with_groups_resolved_in_one_query(self):
+        self.user.groups.add(self.group)
+        self.user.user_permissions.add(Permission.objects.get(codename='view_group'))
+        cache.clear()
+        with self.assertNumQueries(1):
+            claims = get_user_claims(self.user)
+        self.assertEqual(claims['perms'], ['auth.change_group', 'auth.view_group'])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user_claims(self.user), claims)
+
+    def test_local_memory_cache_keeps_claims_briefly(self):
+        from . import claims
+        with override_settings(CLAIMS_CACHE_TIMEOUT=3600, CLAIMS_LOCAL_CACHE_TIMEOUT=30):
+            self.assertEqual(claims._timeout(), 30)
+            with mock.patch.object(claims, '_cache', return_value=mock.Mock()):
+                self.assertEqual(claims._timeout(), 3600)
+
+    def test_profile_role_follows_the_user_not_the_token(self):
+        self.login_claims()
+        CustomUser.objects.filter(pk=self.user.pk).update(is_staff=True)
+        self.assertEqual(self.client.get(reverse('custom_auth:user_profile')).json()['role'], 'admin')
+
+    def test_membership_change_invalidates_user_claims(self):
+        self.assertEqual(get_user_claims(self.user)['perms'], [])
+        self.user.groups.add(self.group)
+        self.assertEqual(get_user_claims(self.user)['perms'], ['auth.change_group'])
+        self.group.user_set.remove(self.user)
+        self.assertEqual(get_user_claims(self.user)['perms'], [])
+
+    def test_group_permission_change_invalidates_group_cache(self):
+        self.user.groups.add(self.group)
+        get_user_claims(self.user)
+        self.group.permissions.add(Permission.objects.get(codename='view_group'))
+        self.assertEqual(get_user_claims(self.user)['perms'], ['auth.change_group', 'auth.view_group'])
+
+    def test_refresh_reissues_current_claims(self):
+        self.login_claims()
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.post(reverse('custom_auth:token_refresh'))
+        self.assertEqual(AccessToken(response.cookies['access_token'].value)['role'], 'admin')
+
+
+class AdminChangelistTests(TestCase):
+
+    def setUp(self):
+        admin_user = CustomUser.objects.create_superuser(
+            username='admin', email='admin@example.com', password='adminpassword123'
+        )
+        self.client.force_login(admin_user)
+        seed_users(4)
+        self.url = reverse('admin:custom_auth_customuser_changelist')
+
+    @mock.patch.object(CustomUserAdmin, 'list_per_page', 2)
+    def test_keyset_pagination_walks_all_users(self):
+        seen = []
+        url = self.url
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            cl = response.context['cl']
+            seen.extend(user.email for user in cl.result_list)
+            url = self.url + cl.next_page_url if cl.next_page_url else None
+        self.assertEqual(seen, sorted(CustomUser.objects.values_list('email', flat=True)))
+
+    @mock.patch.object(CustomUserAdmin, 'list_per_page', 2)
+    def test_cursor_combines_with_filters(self):
+        response = self.client.get(self.url, {'is_staff__exact': '0', 'after': 'bench1@example.com'})
+        emails = [user.email for user in response.context['cl'].result_list]
+        self.assertEqual(emails, ['bench2@example.com', 'bench3@example.com'])
+
+    def test_page_number_falls_back_to_offset_paging(self):
+        response = self.client.get(self.url, {'p': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['cl'].keyset_paging)
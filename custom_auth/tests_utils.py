@@ -0,0 +1,112 @@
+"""
+Вспомогательный код для тестов `custom_auth`.
+
+`PerformanceBudgetMixin` проверяет бюджеты из `custom_auth.perf_budgets` и при
+превышении выводит превышенные показатели с разницей относительно бюджета, а при
+превышении числа запросов — и список выполненных запросов.
+"""
+import contextlib
+import math
+import tracemalloc
+from unittest import mock
+
+from django.contrib.auth.hashers import get_hashers
+from django.db import connection
+from django.db.models.sql.compiler import SQLCompiler
+from django.test.utils import CaptureQueriesContext
+
+from .perf_budgets import PERFORMANCE_BUDGETS
+
+
+class PerformanceBudgetMixin:
+    """
+    Примесь к `APITestCase` с проверкой бюджетов из `PERFORMANCE_BUDGETS`.
+
+    Пример::
+
+        with self.assertWithinBudget('login', 'POST'):
+            self.client.post(reverse('custom_auth:login'), data, format='json')
+    """
+    budgets = PERFORMANCE_BUDGETS
+
+    @contextlib.contextmanager
+    def count_hashes(self):
+        """
+        Считает вызовы `encode`/`verify` всех хешеров из `PASSWORD_HASHERS`.
+
+        :return: Список из одного элемента — счётчик вызовов.
+        :rtype: list[int]
+        """
+        calls = [0]
+        depth = [0]
+        with contextlib.ExitStack() as stack:
+            for hasher in get_hashers():
+                for method_name in ('encode', 'verify'):
+                    original = getattr(type(hasher), method_name)
+
+                    def counted(self_, *args, _original=original, **kwargs):
+                        # verify() вызывает encode() внутри себя — считаем только внешний вызов
+                        if not depth[0]:
+                            calls[0] += 1
+                        depth[0] += 1
+                        try:
+                            return _original(self_, *args, **kwargs)
+                        finally:
+                            depth[0] -= 1
+
+                    stack.enter_context(mock.patch.object(type(hasher), method_name, counted))
+            yield calls
+
+    @staticmethod
+    def _is_savepoint(sql):
+        return sql.startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT'))
+
+    @contextlib.contextmanager
+    def assertWithinBudget(self, url_name, method):
+        """
+        Проверяет, что код внутри блока укладывается в бюджет `url_name`/`method`.
+
+        :param url_name: Имя URL из `custom_auth.urls`.
+        :type url_name: str
+        :param method: HTTP-метод.
+        :type method: str
+        """
+        budget = self.budgets[url_name][method.upper()]
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        try:
+            with contextlib.ExitStack() as stack:
+                # Silk, однажды включившись, оставляет SQLCompiler.execute_sql подменённым
+                # (с EXPLAIN на каждый запрос) — на время замера возвращаем оригинал
+                if hasattr(SQLCompiler, '_execute_sql'):
+                    stack.enter_context(mock.patch.object(SQLCompiler, 'execute_sql', SQLCompiler._execute_sql))
+                queries = stack.enter_context(CaptureQueriesContext(connection))
+                hashes = stack.enter_context(self.count_hashes())
+                tracemalloc.reset_peak()
+                baseline, _ = tracemalloc.get_traced_memory()
+                yield
+                _, peak = tracemalloc.get_traced_memory()
+        finally:
+            if not tracing:
+                tracemalloc.stop()
+
+        alloc_kb = (peak - baseline) / 1024
+        # Точки сохранения появляются из-за транзакции TestCase, в продакшене их нет
+        counted = [query for query in queries.captured_queries if not self._is_savepoint(query['sql'])]
+        measured = (
+            ('SQL queries', len(counted), budget.queries, ''),
+            ('password hash calls', hashes[0], budget.hashes, ''),
+            ('peak allocation', math.ceil(alloc_kb), budget.alloc_kb, ' KB'),
+        )
+        problems = [
+            f'{metric}: {value}{unit}, budget {limit}{unit} (+{value - limit}{unit})'
+            for metric, value, limit, unit in measured if value > limit
+        ]
+        if problems:
+            message = f'{method.upper()} {url_name} exceeded its performance budget:\n  ' + '\n  '.join(problems)
+            if len(counted) > budget.queries:
+                message += f'\nExecuted queries ({len(counted)}):\n' + '\n'.join(
+                    f'  {number}. {query["sql"]}' for number, query in enumerate(counted, 1)
+                )
+            self.fail(message)
@@ -0,0 +1,155 @@
+"""
+Компактный формат JWT для cookies, общих для всех поддоменов `.drunar.space`.
+
+При включённом `COMPACT_TOKENS` токены подписываются с короткими именами claims
+(``token_type`` -> ``t``, ``user_id`` -> ``u`` и т. д.), UUID пользователя
+передаётся как 16 байт в base64url (22 символа вместо 36), тип токена — одной
+буквой, а `jti` — 12 случайных байт (16 символов вместо 32).
+
+Внутри процесса payload всегда хранится с обычными именами: `CompactTokenBackend`
+сжимает его при подписи и разворачивает при проверке. Поэтому остальной код
+(`JWTAuthentication`, blacklist, `custom_auth.claims`) формат не различает, а
+токены старого формата продолжают проверяться — переключать `COMPACT_TOKENS`
+можно без разлогинивания пользователей. Включать его следует после того, как
+соседние сервисы, проверяющие токены, тоже научатся читать компактный формат.
+"""
+import base64
+import binascii
+import secrets
+import uuid
+
+from django.conf import settings
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.state import token_backend
+
+from .claims import PERMISSIONS_CLAIM, ROLE_CLAIM
+
+# Ключ, по которому компактный payload отличается от обычного
+COMPACT_TYPE_CLAIM = 't'
+COMPACT_TOKEN_TYPES = {'access': 'a', 'refresh': 'r'}
+
+
+def compact_tokens_enabled():
+    return getattr(settings, 'COMPACT_TOKENS', False)
+
+
+def _compact_names():
+    return {
+        api_settings.TOKEN_TYPE_CLAIM: COMPACT_TYPE_CLAIM,
+        api_settings.JTI_CLAIM: 'j',
+        api_settings.USER_ID_CLAIM: 'u',
+        ROLE_CLAIM: 'r',
+        PERMISSIONS_CLAIM: 'p',
+    }
+
+
+def encode_user_id(value):
+    """
+    Кодирует UUID в 22 символа base64url; прочие значения возвращает как есть.
+    """
+    try:
+        raw = uuid.UUID(str(value)).bytes
+    except ValueError:
+        return value
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def decode_user_id(value):
+    """
+    Обратное преобразование к `encode_user_id`: возвращает UUID строкой.
+    """
+    if not isinstance(value, str) or len(value) != 22:
+        return value
+    try:
+        return str(uuid.UUID(bytes=base64.urlsafe_b64decode(value + '==')))
+    except (binascii.Error, ValueError):
+        return value
+
+
+def compact_payload(payload):
+    """
+    Переводит payload с обычными именами claims в компактный формат.
+
+    :param payload: Payload токена.
+    :type payload: dict
+    :return: Новый словарь для подписи.
+    :rtype: dict
+    """
+    names = _compact_names()
+    compact = {}
+    for name, value in payload.items():
+        if name == api_settings.TOKEN_TYPE_CLAIM:
+            value = COMPACT_TOKEN_TYPES.get(value, value)
+        elif name == api_settings.USER_ID_CLAIM:
+            value = encode_user_id(value)
+        compact[names.get(name, name)] = value
+    return compact
+
+
+def expand_payload(payload):
+    """
+    Переводит компактный payload к обычным именам claims; обычный возвращает как есть.
+
+    :param payload: Проверенный payload токена.
+    :type payload: dict
+    :rtype: dict
+    """
+    if COMPACT_TYPE_CLAIM not in payload or api_settings.TOKEN_TYPE_CLAIM in payload:
+        return payload
+    names = {short: name for name, short in _compact_names().items()}
+    token_types = {short: name for name, short in COMPACT_TOKEN_TYPES.items()}
+    expanded = {}
+    for short, value in payload.items():
+        name = names.get(short, short)
+        if name == api_settings.TOKEN_TYPE_CLAIM:
+            value = token_types.get(value, value)
+        elif name == api_settings.USER_ID_CLAIM:
+            value = decode_user_id(value)
+        expanded[name] = value
+    return expanded
+
+
+class CompactTokenBackend:
+    """
+    Обёртка над `TokenBackend` simplejwt: сжимает payload при подписи
+    (если включён `COMPACT_TOKENS`) и разворачивает при проверке (всегда).
+    """
+    def __init__(self, backend):
+        self.backend = backend
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def encode(self, payload):
+        if compact_tokens_enabled():
+            payload = compact_payload(payload)
+        return self.backend.encode(payload)
+
+    def decode(self, token, verify=True):
+        return expand_payload(self.backend.decode(token, verify=verify))
+
+
+compact_token_backend = CompactTokenBackend(token_backend)
+
+
+class CompactTokenMixin:
+    """
+    Подключает `CompactTokenBackend` и короткий `jti` к классам токенов simplejwt.
+    """
+    def get_token_backend(self):
+        return compact_token_backend
+
+    def set_jti(self):
+        if compact_tokens_enabled():
+            self.payload[api_settings.JTI_CLAIM] = secrets.token_urlsafe(12)
+        else:
+            super().set_jti()
+
+
+class AccessToken(CompactTokenMixin, tokens.AccessToken):
+    pass
+
+
+class RefreshToken(CompactTokenMixin, tokens.RefreshToken):
+    access_token_class = AccessToken
@@ -1,12 +1,20 @@
 from django.urls import path
-from .views import RegisterView, LogoutView, UserProfileView, CustomTokenObtainPairView, CookieTokenRefreshView
+from .views import (
+    RegisterView, LogoutView, UserProfileView, CustomTokenObtainPairView, CookieTokenRefreshView,
+    SessionListView, SessionRevokeView, SessionRevokeAllView, ConfirmEmailView, AvailabilityView,
+)
 
 app_name = 'custom_auth'
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
+    path('confirm-email/', ConfirmEmailView.as_view(), name='confirm_email'),
+    path('availability/', AvailabilityView.as_view(), name='availability'),
     path('login/', CustomTokenObtainPairView.as_view(), name='login'),
     path('logout/', LogoutView.as_view(), name='logout'),
     path('token/refresh/', CookieTokenRefreshView.as_view(), name='token_refresh'),
     path('profile/', UserProfileView.as_view(), name='user_profile'),
+    path('sessions/', SessionListView.as_view(), name='sessions'),
+    path('sessions/revoke-all/', SessionRevokeAllView.as_view(), name='sessions_revoke_all'),
+    path('sessions/<str:jti>/revoke/', SessionRevokeView.as_view(), name='session_revoke'),
 ]
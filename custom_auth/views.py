@@ -1,23 +1,36 @@
-from .models import CustomUser
+from .admission import AdmissionControlMixin
+from .availability import check_availability
+from .claims import add_claims, get_user_claims_by_id
+from .confirmation import confirm_email, send_confirmation_email
+from .cookies import (
+    delete_auth_cookies, get_refresh_cookie, get_refresh_cookies, set_access_cookie, set_refresh_cookie,
+)
+from .devices import live_sessions, register_device, revoke_sessions, token_jti
+from .events import record_event
+from .models import AuthEvent, CustomUser
 from rest_framework import generics, permissions, status
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
 from .serializers import RegisterSerializer, UserProfileUpdateSerializer
+from .tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
+from django.conf import settings
+from django.db import transaction
 from django.http import JsonResponse
-import datetime
-from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework import status
 
 
 # Регистрация
-class RegisterView(generics.CreateAPIView):
+class RegisterView(AdmissionControlMixin, generics.CreateAPIView):
     """
     Представление для регистрации нового пользователя.
 
     Позволяет любому пользователю создавать новый аккаунт, предоставляя необходимые данные.
+    Число одновременных регистраций ограничено (`custom_auth.admission`).
     """
     queryset = CustomUser.objects.all()
     serializer_class = RegisterSerializer
@@ -27,17 +40,82 @@ class RegisterView(generics.CreateAPIView):
         """
         Переопределяет метод для дополнительной обработки при создании пользователя.
 
+        При `EMAIL_CONFIRMATION_REQUIRED` письмо подтверждения ставится в outbox в той же
+        транзакции, что и создание пользователя; отправляет его ``manage.py send_outbox``.
+
         В текущей реализации можно добавить пользователя в определённую группу,
         раскомментировав соответствующие строки.
 
         :param serializer: Сериализатор, содержащий данные для создания пользователя.
         :type serializer: RegisterSerializer
         """
-        user = serializer.save()
+        if getattr(settings, 'EMAIL_CONFIRMATION_REQUIRED', False):
+            with transaction.atomic():
+                user = serializer.save()
+                send_confirmation_email(user)
+        else:
+            user = serializer.save()
+        record_event(AuthEvent.REGISTER, self.request, user)
         # user_group = Group.objects.get(name='user')  # Назначаем группу по умолчанию
         # user.groups.add(user_group)
 
 
+# Подтверждение почты
+class ConfirmEmailView(APIView):
+    """
+    Представление для подтверждения почты по токену из письма.
+
+    Подпись и срок токена проверяются без обращения к БД, активация — один UPDATE.
+    """
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+
+    def post(self, request):
+        """
+        Обрабатывает POST-запрос с токеном подтверждения.
+
+        :param request: HTTP-запрос с полем `token`.
+        :type request: rest_framework.request.Request
+        :return: Ответ с сообщением или 400, если токен неверен, истёк или уже использован.
+        :rtype: rest_framework.response.Response
+        """
+        token = request.data.get('token')
+        if not isinstance(token, str) or not confirm_email(token):
+            return Response({"detail": "Invalid or expired confirmation token."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({"message": "Email confirmed"}, status=status.HTTP_200_OK)
+
+
+# Проверка занятости имени и почты
+class AvailabilityView(APIView):
+    """
+    Представление для проверки, свободны ли имя пользователя и почта, при заполнении
+    формы регистрации.
+
+    Значения, которых точно нет в фильтре Блума воркера, считаются свободными без
+    обращения к БД (`custom_auth.availability`).
+    """
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+
+    def get(self, request):
+        """
+        Обрабатывает GET-запрос с параметрами `username` и/или `email`.
+
+        :param request: HTTP-запрос.
+        :type request: rest_framework.request.Request
+        :return: Ответ вида ``{"username": true, "email": false}`` (true — свободно)
+            или 400, если не передано ни одного значения.
+        :rtype: rest_framework.response.Response
+        """
+        username = request.query_params.get('username', '').strip() or None
+        email = request.query_params.get('email', '').strip() or None
+        if username is None and email is None:
+            return Response({"detail": "Pass username and/or email."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(check_availability(username=username, email=email), status=status.HTTP_200_OK)
+
+
 # Получение данных текущего пользователя
 class UserProfileView(APIView):
     """
@@ -87,11 +165,38 @@ class UserProfileView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def blacklist_refresh_cookies(request, skip_user_id=None):
+    """
+    Заносит в blacklist все refresh-токены из cookies запроса.
+
+    Кроме cookie на `REFRESH_COOKIE_PATH` клиент может прислать старую cookie на
+    ``/`` с другим токеном; аннулировать нужно оба.
+
+    :param request: HTTP-запрос.
+    :type request: rest_framework.request.Request
+    :param skip_user_id: Пользователь, токены которого уже отозваны и не проверяются.
+    :return: id пользователя из первого аннулированного токена или None.
+    """
+    user_id = None
+    for value in get_refresh_cookies(request):
+        try:
+            if skip_user_id is not None and str(
+                    RefreshToken(value, verify=False).get(api_settings.USER_ID_CLAIM)) == str(skip_user_id):
+                continue
+            token = RefreshToken(value)
+            token.blacklist()
+        except TokenError:
+            continue  # Токен истёк или уже отозван
+        if user_id is None:
+            user_id = token[api_settings.USER_ID_CLAIM]
+    return user_id
+
+
 class LogoutView(APIView):
     """
     Представление для выхода пользователя из системы.
 
-    Аннулирует refresh-токен и удаляет токены из cookies.
+    Аннулирует refresh-токены из cookies и удаляет cookies с токенами.
     """
     def post(self, request):
         """
@@ -102,26 +207,24 @@ class LogoutView(APIView):
         :return: Ответ с сообщением об успешном выходе.
         :rtype: rest_framework.response.Response
         """
-        try:
-            refresh_token = request.COOKIES.get('refresh_token')
-            token = RefreshToken(refresh_token)
-            token.blacklist()  # Аннулируем токен
-        except Exception as e:
-            pass  # В случае ошибки продолжаем
+        user_id = blacklist_refresh_cookies(request)
+        if user_id is not None:
+            record_event(AuthEvent.LOGOUT, request, user_id)
 
         response = Response({"message": "Logout successful"},
                             status=status.HTTP_205_RESET_CONTENT)
-        response.delete_cookie('access_token')
-        response.delete_cookie('refresh_token')
+        delete_auth_cookies(response)
         return response
 
 
 # Логин и получение токенов
-class CustomTokenObtainPairView(TokenObtainPairView):
+class CustomTokenObtainPairView(AdmissionControlMixin, TokenObtainPairView):
     """
     Представление для аутентификации пользователя и получения JWT-токенов.
 
     При успешной аутентификации возвращает токены и устанавливает их в httpOnly cookies.
+    Число одновременных логинов ограничено (`custom_auth.admission`): при перегрузке
+    возвращается 503 с заголовком ``Retry-After``.
     """
     def post(self, request, *args, **kwargs):
         """
@@ -132,15 +235,24 @@ class CustomTokenObtainPairView(TokenObtainPairView):
         :return: Ответ с сообщением и установкой токенов в cookies.
         :rtype: django.http.JsonResponse
         """
-        response = super().post(request, *args, **kwargs)
-        data = response.data
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+        except AuthenticationFailed:
+            record_event(AuthEvent.LOGIN_FAILURE, request, username=str(request.data.get('username', '')))
+            raise
+        data = serializer.validated_data
 
         # Получаем access и refresh токены
         access_token = data.get('access')
         refresh_token = data.get('refresh')
 
-        # Получаем пользователя на основе введенных данных
-        user = self.get_user(request.data['username'])
+        # Пользователь уже загружен сериализатором при аутентификации
+        user = serializer.user
+        register_device(refresh_token, request)
+        record_event(AuthEvent.LOGIN_SUCCESS, request, user)
 
         # Создаем ответ с телом, которое включает имя пользователя и почту
         response = JsonResponse({
@@ -150,45 +262,13 @@ class CustomTokenObtainPairView(TokenObtainPairView):
             "email": user.email,
         })
 
-        # Устанавливаем токены в httpOnly cookies
-        access_expiry = datetime.datetime.utcnow() + datetime.timedelta(minutes=60)
-        refresh_expiry = datetime.datetime.utcnow() + datetime.timedelta(days=10)
-
-        response.set_cookie(
-            key='access_token',
-            value=access_token,
-            httponly=True,  # фронтенд будет пытаться получить токен через JS, что не рекомендуется
-            secure=False,  # Установи True для HTTPS # Установите False для разработки
-            samesite='Lax',  # Ограничивает отправку токенов в разных контекстах
-            expires=access_expiry,
-            domain=".drunar.space"  # Делаем куки доступными для всех поддоменов
-        )
-
-        response.set_cookie(
-            key='refresh_token',
-            value=refresh_token,
-            httponly=True, #True
-            secure=False,
-            samesite='Lax',
-            expires=refresh_expiry,
-            domain=".drunar.space"  # Делаем куки доступными для всех поддоменов
-        )
+        # Устанавливаем токены в httpOnly cookies: access — для всех поддоменов,
+        # refresh — только на пути эндпоинтов, которым он нужен
+        set_access_cookie(response, access_token)
+        set_refresh_cookie(response, refresh_token)
 
         return response
 
-    def get_user(self, username):
-        """
-        Получает пользователя по имени пользователя.
-
-        :param username: Имя пользователя.
-        :type username: str
-        :return: Экземпляр пользователя.
-        :rtype: CustomUser
-        """
-        from django.contrib.auth import get_user_model
-        user = get_user_model()
-        return user.objects.get(username=username)
-
 
 # Обновление токена
 class CookieTokenRefreshView(APIView):
@@ -207,7 +287,7 @@ class CookieTokenRefreshView(APIView):
         :rtype: rest_framework.response.Response
         """
         # Извлекаем refresh_token из cookies
-        refresh_token = request.COOKIES.get('refresh_token')
+        refresh_token = get_refresh_cookie(request)
 
         if refresh_token is None:
             return Response({"detail": "Refresh token missing in cookies"},
@@ -217,24 +297,98 @@ class CookieTokenRefreshView(APIView):
             # Попытка создать новый access-токен из refresh-токена
             refresh = RefreshToken(refresh_token)
             access_token = refresh.access_token
-        except InvalidToken:
+        except TokenError:  # истёк, подпись неверна или токен отозван (blacklist)
             return Response({"detail": "Invalid refresh token"},
                             status=status.HTTP_400_BAD_REQUEST)
 
+        # Актуализируем роль и права: они могли измениться после выпуска refresh-токена
+        user_id = refresh[api_settings.USER_ID_CLAIM]
+        record_event(AuthEvent.REFRESH, request, user_id)
+        claims = get_user_claims_by_id(user_id)
+        if claims is not None:
+            add_claims(access_token, claims)
+
         # Создаем ответ и отправляем новый access-токен в cookies
         response = Response({"access_token": str(access_token)},
                             status=status.HTTP_200_OK)
 
-        access_expiry = datetime.datetime.utcnow() + datetime.timedelta(minutes=60)
+        set_access_cookie(response, access_token)
+
+        return response
+
+
+# Сессии (устройства) пользователя
+class SessionListView(APIView):
+    """
+    Представление для просмотра живых сессий аутентифицированного пользователя.
+
+    Сессия — это невыпавший из срока и неотозванный refresh-токен.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """
+        Обрабатывает GET-запрос для получения списка сессий.
+
+        Текущая сессия (refresh-токен из cookies) помечается флагом `current`.
 
-        response.set_cookie(
-            key='access_token',
-            value=access_token,
-            httponly=True,
-            secure=False,
-            samesite='Lax',
-            expires=access_expiry,
-            domain=".drunar.space"
-        )
+        :param request: HTTP-запрос.
+        :type request: rest_framework.request.Request
+        :return: Ответ со списком сессий.
+        :rtype: rest_framework.response.Response
+        """
+        current_jti = token_jti(get_refresh_cookie(request))
+        sessions = live_sessions(request.user)
+        for session in sessions:
+            session['current'] = session['jti'] == current_jti
+        return Response(sessions, status=status.HTTP_200_OK)
+
+
+class SessionRevokeView(APIView):
+    """
+    Представление для отзыва одной сессии пользователя по `jti`.
+    """
+    permission_classes = [IsAuthenticated]
 
+    def post(self, request, jti):
+        """
+        Обрабатывает POST-запрос для отзыва сессии.
+
+        :param request: HTTP-запрос.
+        :type request: rest_framework.request.Request
+        :param jti: Идентификатор refresh-токена сессии.
+        :type jti: str
+        :return: Ответ с сообщением или 404, если живой сессии с таким `jti` у пользователя нет.
+        :rtype: rest_framework.response.Response
+        """
+        if not revoke_sessions(request.user, jti=jti):
+            return Response({"detail": "Session not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"message": "Session revoked"}, status=status.HTTP_200_OK)
+
+
+class SessionRevokeAllView(APIView):
+    """
+    Представление для выхода пользователя со всех устройств.
+
+    Все refresh-токены пользователя заносятся в blacklist одним запросом,
+    токены текущего клиента удаляются из cookies.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        """
+        Обрабатывает POST-запрос для отзыва всех сессий.
+
+        :param request: HTTP-запрос.
+        :type request: rest_framework.request.Request
+        :return: Ответ с количеством отозванных сессий.
+        :rtype: rest_framework.response.Response
+        """
+        revoked = revoke_sessions(request.user)
+        # Токены пользователя отозваны одним запросом; cookies другого пользователя
+        # (например, старая cookie на ``/``) аннулируются по отдельности
+        blacklist_refresh_cookies(request, skip_user_id=request.user.pk)
+        response = Response({"message": "All sessions revoked", "revoked": revoked},
+                            status=status.HTTP_200_OK)
+        delete_auth_cookies(response)
         return response
@@ -0,0 +1,193 @@
+"""
+Продакшен-конфигурация Gunicorn для sr_auth_api.
+
+Запуск: ``gunicorn -c gunicorn.conf.py sr_auth_api.wsgi:application``.
+
+Количество воркеров и потоков вычисляется из числа доступных ядер и доли
+CPU-нагрузки, приходящейся на хеширование паролей (PBKDF2 при логине и
+регистрации). Все значения можно переопределить переменными окружения
+``GUNICORN_*``.
+"""
+
+import gc
+import os
+import resource
+import time
+
+_BOOT_STARTED_AT = time.monotonic()
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value not in (None, '') else default
+
+
+def _available_cores():
+    """
+    Возвращает количество ядер, реально доступных процессу (учитывает cpuset/affinity контейнера).
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover - не Linux
+        return os.cpu_count() or 1
+
+
+def _memory():
+    """
+    Возвращает строку с памятью текущего процесса в мегабайтах для лога.
+
+    RSS включает страницы, общие с мастером через copy-on-write, поэтому для оценки
+    стоимости воркера нужны PSS (общие страницы делятся между процессами поровну) и
+    Private (только страницы этого процесса) из ``/proc/self/smaps_rollup``.
+    Без него (не Linux) выводится пиковый RSS.
+    """
+    fields = {}
+    try:
+        with open('/proc/self/smaps_rollup') as rollup:
+            for line in rollup:
+                name, _, value = line.partition(':')
+                if value.strip().endswith('kB'):
+                    fields[name] = int(value.split()[0])
+    except OSError:
+        return 'maxrss=%.1fMB' % (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+    private = fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    return 'rss=%.1fMB pss=%.1fMB private=%.1fMB' % (
+        fields.get('Rss', 0) / 1024, fields.get('Pss', 0) / 1024, private / 1024,
+    )
+
+
+CORES = _available_cores()
+
+# Доля времени запроса, которую воркер занимает CPU (хеширование пароля).
+# Чем она выше, тем меньше смысла в потоках: GIL не даёт им хешировать параллельно.
+HASHING_SHARE = min(max(_env_float('GUNICORN_HASHING_SHARE', 0.6), 0.05), 1.0)
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# Процессов столько, сколько ядер (+1 на ожидание I/O), потоки закрывают
+# I/O-часть запроса (БД, сеть): threads ~= 1 / доля CPU. Ещё два потока — запас
+# под логины, ждущие в очереди `custom_auth.admission`, и дешёвые эндпоинты:
+# одновременное хеширование ограничивает она, а не число потоков.
+workers = _env_int('GUNICORN_WORKERS', CORES + 1)
+threads = _env_int('GUNICORN_THREADS', max(1, round(1 / HASHING_SHARE)) + 2)
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+# Настройки приложения (ADMISSION_*) выводят значения по умолчанию из этих чисел;
+# конфиг читается до загрузки приложения, поэтому они передаются через окружение.
+os.environ['GUNICORN_WORKERS'] = str(workers)
+os.environ['GUNICORN_THREADS'] = str(threads)
+
+# Приложение импортируется один раз в мастере, воркеры получают страницы памяти
+# через copy-on-write. GUNICORN_PRELOAD=0 — для сравнения памяти и времени старта.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') not in ('0', 'false', 'False')
+
+# Перезапуск воркеров для ограничения роста памяти; jitter не даёт всем
+# воркерам перезапуститься одновременно.
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 2000)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', 200)
+
+# Keep-alive немного больше, чем idle timeout балансировщика перед нами.
+keepalive = _env_int('GUNICORN_KEEPALIVE', 75)
+timeout = _env_int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+
+# Heartbeat-файлы воркеров в tmpfs, а не на диске контейнера.
+worker_tmp_dir = os.environ.get('GUNICORN_WORKER_TMP_DIR', '/dev/shm')
+
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOGLEVEL', 'info')
+
+
+def when_ready(server):
+    """
+    Вызывается в мастере после загрузки приложения (при ``preload_app``).
+
+    Прогревает независимые от процесса части приложения один раз в мастере:
+    воркеры получают их готовыми через fork.
+    """
+    if preload_app:
+        from sr_auth_api import warmup
+        warmup.warm_up(warmup.configured_steps(warmup.PROCESS_STEPS))
+    server.log.info(
+        "Master ready in %.3fs, %s, workers=%s, threads=%s, worker_class=%s, preload_app=%s",
+        time.monotonic() - _BOOT_STARTED_AT, _memory(), workers, threads, worker_class, preload_app,
+    )
+
+
+def pre_fork(server, worker):
+    """
+    Закрывает соединения с БД, открытые мастером при импорте приложения,
+    чтобы воркеры не унаследовали общий сокет.
+
+    ``gc.freeze()`` переносит уже созданные объекты в permanent generation:
+    сборщик мусора в воркере не будет их обходить и трогать refcount-страницы,
+    поэтому они остаются общими через copy-on-write.
+
+    Без ``preload_app`` мастер не загружает приложение, и делать нечего.
+    """
+    if not preload_app:
+        return
+    from django.db import connections
+    connections.close_all()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """
+    Сбрасывает унаследованное от мастера состояние в новом воркере.
+    """
+    worker._boot_started_at = time.monotonic()
+    if not preload_app:
+        return
+    from django.db import connections
+
+    # Дескрипторы соединений мастера в воркере использовать нельзя —
+    # отбрасываем их без закрытия сокета на стороне сервера.
+    for conn in connections.all(initialized_only=True):
+        conn.connection = None
+
+
+def post_worker_init(worker):
+    """
+    Прогревает воркер (соединение с БД, а без ``preload_app`` — и всё остальное)
+    и логирует время старта и память воркера после инициализации приложения.
+    """
+    from sr_auth_api import warmup
+    steps = warmup.WORKER_STEPS if preload_app else warmup.PROCESS_STEPS + warmup.WORKER_STEPS
+    warmup.warm_up(warmup.configured_steps(steps))
+
+    started_at = getattr(worker, '_boot_started_at', _BOOT_STARTED_AT)
+    worker.log.info(
+        "Worker %s booted in %.3fs, %s",
+        worker.pid, time.monotonic() - started_at, _memory(),
+    )
+
+
+def child_exit(server, worker):
+    """
+    Вызывается в мастере после завершения воркера (в т.ч. убитого по таймауту):
+    освобождает его долю общего лимита логинов (`custom_auth.admission`).
+    Общий лимит существует только при ``preload_app``.
+    """
+    if not preload_app:
+        return
+    from custom_auth.admission import release_worker
+
+    release_worker(worker.pid)
+
+
+def worker_exit(server, worker):
+    """
+    Дописывает журнал событий аутентификации и логирует память воркера при завершении
+    (в т.ч. по ``max_requests``).
+    """
+    from custom_auth.events import close_recorder
+
+    close_recorder()
+    server.log.info("Worker %s exiting, %s", worker.pid, _memory())
@@ -0,0 +1,45 @@
+"""
+Проверки конфигурации проекта (``manage.py check --deploy``).
+
+`CsrfViewMiddleware` и `XFrameOptionsMiddleware` подключены через обёртки
+`sr_auth_api.middleware.skip_for_api`, поэтому встроенные проверки Django
+(security.W002, security.W003) их не находят и отключены в
+`SILENCED_SYSTEM_CHECKS`. Вместо них `check_security_middleware` проверяет, что в
+`MIDDLEWARE` есть подклассы этих middleware.
+"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+from django.middleware.clickjacking import XFrameOptionsMiddleware
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils.module_loading import import_string
+
+# (базовый класс, id заменяемой проверки Django)
+REQUIRED_MIDDLEWARE = (
+    (XFrameOptionsMiddleware, 'security.W002'),
+    (CsrfViewMiddleware, 'security.W003'),
+)
+
+
+@register(Tags.security, deploy=True)
+def check_security_middleware(app_configs, **kwargs):
+    """
+    Проверяет, что XFrameOptionsMiddleware и CsrfViewMiddleware (или их обёртки) есть в `MIDDLEWARE`.
+
+    :rtype: list[django.core.checks.Warning]
+    """
+    classes = []
+    for path in settings.MIDDLEWARE:
+        try:
+            classes.append(import_string(path))
+        except ImportError:
+            continue  # об ошибке импорта сообщит сам Django при загрузке middleware
+    warnings = []
+    for base, check_id in REQUIRED_MIDDLEWARE:
+        if not any(isinstance(cls, type) and issubclass(cls, base) for cls in classes):
+            warnings.append(Warning(
+                f'{base.__module__}.{base.__name__} (or a subclass) is not in MIDDLEWARE.',
+                hint=f'Replaces the silenced {check_id}; add the middleware or its skip_for_api wrapper '
+                     f'from sr_auth_api.middleware.',
+                id=f'sr_auth_api.{check_id.split(".")[1]}',
+            ))
+    return warnings
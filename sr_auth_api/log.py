@@ -0,0 +1,234 @@
+"""
+Неблокирующий конвейер логирования.
+
+На пути запроса работает только `QueueJSONHandler`: он кладёт запись в ограниченную
+очередь и сразу возвращает управление. Форматирование в JSON и запись в stdout
+выполняет фоновый `logging.handlers.QueueListener`. Если очередь заполнена, запись
+отбрасывается и учитывается в счётчике `dropped`, поток запроса не блокируется.
+
+Модуль не требует настроенного Django (импортирует только `django.core.exceptions`)
+и подключается прямо из `settings.LOGGING`.
+"""
+import atexit
+import datetime
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import weakref
+from logging.handlers import QueueHandler, QueueListener
+
+from django.core.exceptions import ImproperlyConfigured
+
+# Стандартные атрибуты LogRecord, которые не попадают в JSON как extra-поля
+_RESERVED_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+def parse_levels(value):
+    """
+    Разбирает строку вида ``"django.db.backends=WARNING,custom_auth=DEBUG"``.
+
+    :param value: Строка из переменной окружения.
+    :type value: str
+    :return: Словарь ``{имя логгера: уровень}``.
+    :rtype: dict
+    :raises ImproperlyConfigured: Если элемент не имеет вида ``логгер=значение``.
+    """
+    levels = {}
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        name, _, level = (part.strip() for part in item.partition('='))
+        if not name or not level:
+            raise ImproperlyConfigured(f'Malformed logger entry {item!r} in {value!r}: expected "logger=value".')
+        levels[name] = level.upper()
+    return levels
+
+
+def parse_rates(value):
+    """
+    Разбирает строку вида ``"django.db.backends=0.01,custom_auth=0.5"``.
+
+    :param value: Строка из переменной окружения.
+    :type value: str
+    :return: Словарь ``{префикс логгера: доля сохраняемых записей}``.
+    :rtype: dict
+    :raises ImproperlyConfigured: Если элемент не имеет вида ``логгер=число``.
+    """
+    rates = {}
+    for name, rate in parse_levels(value).items():
+        try:
+            rates[name] = float(rate)
+        except ValueError:
+            raise ImproperlyConfigured(f'Malformed sample rate {rate!r} for logger {name!r}.') from None
+    return rates
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Форматирует запись в одну строку JSON.
+
+    Помимо времени, уровня, логгера и сообщения в JSON попадают все поля,
+    переданные через ``extra=``.
+    """
+    def format(self, record):
+        payload = {
+            'ts': datetime.datetime.fromtimestamp(record.created, tz=datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            payload['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает лишь часть DEBUG-записей для высоконагруженных категорий.
+
+    Записи уровня INFO и выше не сэмплируются никогда.
+    """
+    def __init__(self, rates=None, name=''):
+        """
+        :param rates: ``{префикс логгера: доля сохраняемых записей}`` или строка для `parse_rates`.
+        :type rates: dict or str or None
+        """
+        super().__init__(name)
+        if isinstance(rates, str):
+            rates = parse_rates(rates)
+        # Более длинные префиксы проверяются первыми
+        self.rates = sorted((rates or {}).items(), key=lambda item: len(item[0]), reverse=True)
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or not self.rates:
+            return True
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + '.'):
+                return rate >= 1 or random.random() < rate
+        return True
+
+
+# Открытые обработчики; atexit и register_at_fork регистрируются один раз на модуль,
+# а не на каждый экземпляр, иначе пересоздание обработчиков копило бы колбэки.
+_handlers = weakref.WeakSet()
+
+
+def _close_handlers():
+    for handler in list(_handlers):
+        handler.close()
+
+
+def _restart_handlers_after_fork():
+    for handler in list(_handlers):
+        handler._restart_after_fork()
+
+
+atexit.register(_close_handlers)
+# Поток слушателя не переживает fork (gunicorn с preload_app):
+# в дочернем процессе создаём новую очередь и запускаем слушателя заново.
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_handlers_after_fork)
+
+
+class QueueJSONHandler(QueueHandler):
+    """
+    Handler для пути запроса: ставит запись в ограниченную очередь и не ждёт вывода.
+
+    Фоновый `QueueListener` форматирует записи `JSONFormatter` и пишет их в поток
+    (по умолчанию stdout). При переполнении очереди запись отбрасывается, а
+    количество отброшенных записей доступно в `dropped` и периодически сообщается
+    отдельной записью уровня WARNING.
+    """
+    def __init__(self, maxsize=10000, stream=None, rates=None):
+        """
+        :param maxsize: Максимальная длина очереди.
+        :type maxsize: int
+        :param stream: Поток вывода для фонового слушателя.
+        :param rates: Доли сэмплирования DEBUG-записей (см. `SamplingFilter`).
+        :type rates: dict or str or None
+        """
+        super().__init__(queue.Queue(maxsize=int(maxsize)))
+        if rates:
+            self.addFilter(SamplingFilter(rates))
+        self.dropped = 0
+        self._reported_dropped = 0
+        self._dropped_lock = threading.Lock()
+
+        self._target = logging.StreamHandler(stream or sys.stdout)
+        self._target.setFormatter(JSONFormatter())
+        self._start_listener()
+        _handlers.add(self)
+
+    def _start_listener(self):
+        self.listener = QueueListener(self.queue, self._target, respect_handler_level=True)
+        self.listener.start()
+
+    def _restart_after_fork(self):
+        if self.listener is None:
+            return
+        self.queue = queue.Queue(maxsize=self.queue.maxsize)
+        self.dropped = self._reported_dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._start_listener()
+
+    def prepare(self, record):
+        """
+        Подготавливает запись к передаче в другой поток без форматирования.
+
+        Аргументы сообщения подставляются сразу (они могут измениться после возврата
+        из вызова логгера), а сборка JSON и traceback откладываются до слушателя.
+        """
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+            return
+        self._report_dropped()
+
+    def _report_dropped(self):
+        """
+        Сообщает о записях, отброшенных с момента предыдущего отчёта.
+        """
+        if self.dropped == self._reported_dropped:
+            return
+        with self._dropped_lock:
+            lost = self.dropped - self._reported_dropped
+            self._reported_dropped = self.dropped
+        if lost:
+            notice = logging.makeLogRecord({
+                'name': __name__,
+                'levelno': logging.WARNING,
+                'levelname': 'WARNING',
+                'msg': f'Log queue overflow: {lost} records dropped',
+                'dropped_total': self.dropped,
+            })
+            try:
+                self.queue.put_nowait(notice)
+            except queue.Full:
+                pass
+
+    def close(self):
+        """
+        Останавливает слушателя, дописав оставшиеся в очереди записи.
+        """
+        _handlers.discard(self)
+        listener, self.listener = getattr(self, 'listener', None), None
+        if listener is not None and listener._thread is not None:
+            listener.stop()
+        super().close()
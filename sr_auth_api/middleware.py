@@ -1,3 +1,143 @@
+import re
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import middleware as auth_middleware
+from django.contrib.messages import middleware as messages_middleware
+from django.contrib.sessions import middleware as sessions_middleware
+from django.http import JsonResponse
+from django.middleware import clickjacking, common, csrf
+from silk import middleware as silk_middleware
+from silk.collector import DataCollector
+
+
+def is_api_request(request):
+    """
+    Проверяет, относится ли запрос к JWT API (пути из `settings.API_PATH_PREFIXES`).
+
+    :param request: Входящий HTTP-запрос.
+    :type request: django.http.HttpRequest
+    :rtype: bool
+    """
+    return request.path_info.startswith(tuple(settings.API_PATH_PREFIXES))
+
+
+def skip_for_api(middleware_class):
+    """
+    Возвращает подкласс middleware, который пропускает запросы к JWT API.
+
+    Для путей из `settings.API_PATH_PREFIXES` запрос сразу передаётся дальше по цепочке,
+    а хуки `process_view`/`process_exception`/`process_template_response` ничего не делают.
+    Для остальных путей (админка, Silk) middleware работает как обычно. Так в `MIDDLEWARE`
+    остаётся один список, а API получает облегчённую цепочку без сессий, сообщений и CSRF
+    по сессии.
+
+    :param middleware_class: Класс middleware.
+    :type middleware_class: type
+    :return: Подкласс с тем же именем.
+    :rtype: type
+    """
+    def __call__(self, request):
+        if is_api_request(request):
+            return self.get_response(request)
+        return middleware_class.__call__(self, request)
+
+    attrs = {'__call__': __call__, '__module__': __name__, '__doc__': middleware_class.__doc__}
+    for hook in ('process_view', 'process_exception', 'process_template_response'):
+        original = getattr(middleware_class, hook, None)
+        if original is None:
+            continue
+
+        def scoped_hook(self, request, *args, _original=original):
+            if is_api_request(request):
+                return args[-1] if _original.__name__ == 'process_template_response' else None
+            return _original(self, request, *args)
+
+        attrs[hook] = scoped_hook
+    return type(middleware_class.__name__, (middleware_class,), attrs)
+
+
+# Полный стек Django только для админки и Silk; API (/auth/) их пропускает
+SessionMiddleware = skip_for_api(sessions_middleware.SessionMiddleware)
+CommonMiddleware = skip_for_api(common.CommonMiddleware)
+CsrfViewMiddleware = skip_for_api(csrf.CsrfViewMiddleware)
+AuthenticationMiddleware = skip_for_api(auth_middleware.AuthenticationMiddleware)
+MessageMiddleware = skip_for_api(messages_middleware.MessageMiddleware)
+XFrameOptionsMiddleware = skip_for_api(clickjacking.XFrameOptionsMiddleware)
+
+
+class SilkyMiddleware(skip_for_api(silk_middleware.SilkyMiddleware)):
+    """
+    Silk только для путей вне API.
+
+    `DataCollector` Silk хранит запрос в thread-local и сбрасывает его лишь в начале
+    следующего перехваченного запроса. Если поток после админки обслуживает API,
+    Silk продолжил бы перехватывать (и EXPLAIN-ить) все его SQL-запросы, поэтому
+    на путях API коллектор очищается.
+    """
+    def __call__(self, request):
+        if is_api_request(request) and DataCollector().request is not None:
+            DataCollector().clear()
+        return super().__call__(request)
+
+
+class CookieJWTOriginCheckMiddleware:
+    """
+    Защита от CSRF для JWT в cookies на путях API.
+
+    Session-based `CsrfViewMiddleware` к API не применяется (представления DRF и так
+    освобождены от неё), а токены уходят браузером автоматически вместе с cookies.
+    Поэтому для небезопасных методов middleware сверяет заголовок `Origin` (или `Referer`,
+    если `Origin` нет) с `CSRF_TRUSTED_ORIGINS`, `CORS_ALLOWED_ORIGIN_REGEXES` и
+    собственным хостом запроса. Запросы без этих заголовков (не из браузера) пропускаются.
+    """
+    UNSAFE_METHODS = frozenset({'POST', 'PUT', 'PATCH', 'DELETE'})
+
+    def __init__(self, get_response):
+        """
+        Инициализирует middleware.
+
+        :param get_response: Функция для получения ответа на запрос.
+        :type get_response: callable
+        """
+        self.get_response = get_response
+        self.trusted_origins = frozenset(settings.CSRF_TRUSTED_ORIGINS)
+        self.trusted_regexes = [re.compile(regex) for regex in getattr(settings, 'CORS_ALLOWED_ORIGIN_REGEXES', [])]
+
+    def __call__(self, request):
+        """
+        Отклоняет небезопасные запросы к API с чужого источника ответом 403.
+
+        :param request: Входящий HTTP-запрос.
+        :type request: django.http.HttpRequest
+        :return: Ответ на запрос.
+        :rtype: django.http.HttpResponse
+        """
+        if request.method in self.UNSAFE_METHODS and is_api_request(request):
+            origin = self.request_origin(request)
+            if origin is not None and not self.is_trusted(request, origin):
+                return JsonResponse({'detail': 'CSRF Failed: Origin checking failed.'}, status=403)
+        return self.get_response(request)
+
+    @staticmethod
+    def request_origin(request):
+        origin = request.META.get('HTTP_ORIGIN')
+        if origin:
+            return origin
+        referer = request.META.get('HTTP_REFERER')
+        if referer:
+            parts = urlsplit(referer)
+            return f'{parts.scheme}://{parts.netloc}'
+        return None
+
+    def is_trusted(self, request, origin):
+        if origin in self.trusted_origins:
+            return True
+        if origin == f'{request.scheme}://{request.get_host()}':
+            return True
+        return any(regex.match(origin) for regex in self.trusted_regexes)
+
+
 class JWTAuthenticationFromCookiesMiddleware:
     """
     Middleware для извлечения JWT-токена из cookies и установки его в заголовок Authorization.
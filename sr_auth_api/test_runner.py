@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Тестовый раннер проекта.
+
+    Как Django подменяет `EMAIL_BACKEND` на locmem, так и журнал событий
+    аутентификации в тестах пишется в память (`custom_auth.events.MemorySink`),
+    чтобы фоновый поток не обращался к тестовой БД вне транзакции теста.
+    """
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._auth_events_sink = settings.AUTH_EVENTS_SINK
+        settings.AUTH_EVENTS_SINK = 'memory'
+
+    def teardown_test_environment(self, **kwargs):
+        settings.AUTH_EVENTS_SINK = self._auth_events_sink
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,128 @@
+import io
+import json
+import logging
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase, override_settings
+from silk.collector import DataCollector
+
+from sr_auth_api import checks, warmup
+from sr_auth_api import log
+from sr_auth_api.log import QueueJSONHandler, SamplingFilter, parse_levels, parse_rates
+
+
+class LoggingPipelineTests(SimpleTestCase):
+
+    def make_record(self, name='custom_auth', level=logging.INFO, msg='message %s', args=('arg',)):
+        return logging.LogRecord(name, level, __file__, 0, msg, args, None)
+
+    def test_records_are_written_as_json_lines(self):
+        stream = io.StringIO()
+        handler = QueueJSONHandler(stream=stream)
+        record = self.make_record()
+        record.user_id = 'abc'
+        handler.handle(record)
+        handler.close()  # дожидаемся, пока слушатель допишет очередь
+
+        payload = json.loads(stream.getvalue().splitlines()[0])
+        self.assertEqual(payload['message'], 'message arg')
+        self.assertEqual(payload['level'], 'INFO')
+        self.assertEqual(payload['user_id'], 'abc')
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = QueueJSONHandler(maxsize=1, stream=io.StringIO())
+        # Останавливаем слушателя, чтобы очередь не разгружалась
+        handler.listener.stop()
+        handler.listener = None
+
+        for _ in range(3):
+            handler.handle(self.make_record())
+
+        self.assertEqual(handler.dropped, 2)
+        handler.close()
+
+    def test_closed_handlers_are_not_kept_for_exit_and_fork(self):
+        handler = QueueJSONHandler(stream=io.StringIO())
+        self.assertIn(handler, log._handlers)
+        handler.close()
+        self.assertNotIn(handler, log._handlers)
+
+    def test_malformed_level_entries_are_rejected(self):
+        self.assertEqual(parse_levels(' custom_auth = debug ,'), {'custom_auth': 'DEBUG'})
+        for value in ('custom_auth', 'custom_auth=', '=DEBUG'):
+            with self.subTest(value=value), self.assertRaises(ImproperlyConfigured):
+                parse_levels(value)
+        with self.assertRaises(ImproperlyConfigured):
+            parse_rates('django.db.backends=often')
+
+    def test_sampling_applies_only_to_debug(self):
+        sampling = SamplingFilter('django.db.backends=0')
+        self.assertFalse(sampling.filter(self.make_record('django.db.backends', logging.DEBUG)))
+        self.assertTrue(sampling.filter(self.make_record('django.db.backends', logging.WARNING)))
+        self.assertTrue(sampling.filter(self.make_record('custom_auth', logging.DEBUG)))
+
+
+class MiddlewareScopeTests(TestCase):
+
+    def test_api_requests_skip_session_stack(self):
+        response = self.client.get('/auth/profile/')
+        self.assertFalse(hasattr(response.wsgi_request, 'session'))
+        self.assertNotIn('X-Frame-Options', response.headers)
+
+    def test_admin_keeps_session_stack(self):
+        response = self.client.get('/admin/login/')
+        self.assertTrue(hasattr(response.wsgi_request, 'session'))
+        self.assertEqual(response.headers['X-Frame-Options'], 'DENY')
+
+    def test_unsafe_api_request_from_foreign_origin_is_rejected(self):
+        response = self.client.post('/auth/logout/', HTTP_ORIGIN='https://evil.example.com')
+        self.assertEqual(response.status_code, 403)
+
+    def test_unsafe_api_request_from_trusted_origin_is_allowed(self):
+        response = self.client.post('/auth/logout/', HTTP_ORIGIN='https://book.drunar.space')
+        self.assertEqual(response.status_code, 205)
+
+    def test_deploy_check_accepts_wrapped_security_middleware(self):
+        self.assertEqual(checks.check_security_middleware(None), [])
+        with override_settings(MIDDLEWARE=['django.middleware.security.SecurityMiddleware']):
+            ids = [warning.id for warning in checks.check_security_middleware(None)]
+        self.assertEqual(ids, ['sr_auth_api.W002', 'sr_auth_api.W003'])
+
+    def test_api_request_clears_profiler_state_left_by_admin(self):
+        self.client.get('/admin/login/')
+        self.client.get('/auth/profile/')
+        self.assertIsNone(DataCollector().request)
+
+
+class WarmupTests(TestCase):
+
+    def test_all_steps_run_and_are_logged(self):
+        # Как в воркере без preload_app: шаги процесса и воркера вместе
+        steps = warmup.configured_steps(warmup.PROCESS_STEPS + warmup.WORKER_STEPS)
+        self.assertEqual(steps[-1], 'requests')
+        with self.assertLogs('sr_auth_api.warmup', 'INFO') as logs:
+            timings = warmup.warm_up(steps)
+        self.assertEqual(list(timings), list(steps))
+        self.assertFalse([record for record in logs.records if record.levelno >= logging.ERROR])
+        self.assertEqual(logs.records[-1].steps, timings)
+
+    def test_synthetic_requests_do_not_touch_the_database(self):
+        with self.assertNumQueries(0):
+            warmup.warm_requests()
+
+    def test_failed_step_does_not_stop_warm_up(self):
+        with mock.patch.dict(warmup.STEPS, {'urls': mock.Mock(side_effect=RuntimeError)}), \
+                self.assertLogs('sr_auth_api.warmup', 'INFO') as logs:
+            timings = warmup.warm_up(['urls', 'drf'])
+        self.assertEqual(list(timings), ['urls', 'drf'])
+        self.assertEqual(logs.records[0].levelno, logging.ERROR)
+
+    def test_configured_steps(self):
+        self.assertEqual(warmup.configured_steps(warmup.PROCESS_STEPS), list(warmup.PROCESS_STEPS))
+        with override_settings(WARMUP_REQUESTS=False):
+            self.assertNotIn('requests', warmup.configured_steps(warmup.PROCESS_STEPS))
+        with override_settings(WARMUP_STEPS=['urls', 'database']):
+            self.assertEqual(warmup.configured_steps(warmup.PROCESS_STEPS), ['urls'])
+        with override_settings(WARMUP_ENABLED=False):
+            self.assertEqual(warmup.configured_steps(warmup.WORKER_STEPS), [])
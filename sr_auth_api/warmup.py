@@ -0,0 +1,208 @@
+"""
+Прогрев воркера до первого запроса.
+
+Первые запросы после деплоя или перезапуска воркера (``max_requests``) платят за
+ленивую инициализацию: компиляцию URL-резолвера, загрузку настроек и рендереров
+DRF, создание backend-а simplejwt, список валидаторов паролей (в т.ч. словарь
+`CommonPasswordValidator` из gzip), первое соединение с БД, импорт silk и фильтр
+занятых имён и адресов (`custom_auth.availability`).
+`warm_up` выполняет эти шаги заранее и логирует время каждого.
+
+Шаги из `PROCESS_STEPS` не зависят от процесса: при ``preload_app`` они
+выполняются один раз в мастере (результат наследуется воркерами через fork),
+иначе — в каждом воркере. Шаги из `WORKER_STEPS` (соединение с БД, фильтр
+занятых имён) выполняются только в воркере. Подключение — хуки в ``gunicorn.conf.py``.
+
+Шаг ``requests`` отправляет в WSGI-приложение синтетические запросы к
+`custom_auth`, которые отклоняются до записи в БД (без аутентификации или с пустым
+телом), и прогревает весь путь запроса: middleware, представления DRF,
+обработку исключений и рендеринг.
+"""
+import io
+import json
+import logging
+import time
+import wsgiref.util
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# (имя URL, метод, тело JSON). Ни один из запросов не проходит проверку данных
+# или аутентификацию, поэтому не пишет в БД и не хеширует пароль.
+SYNTHETIC_REQUESTS = (
+    ('custom_auth:user_profile', 'GET', None),
+    ('custom_auth:sessions', 'GET', None),
+    ('custom_auth:login', 'POST', {}),
+    ('custom_auth:register', 'POST', {}),
+    ('custom_auth:confirm_email', 'POST', {}),
+    ('custom_auth:availability', 'GET', None),
+    ('custom_auth:token_refresh', 'POST', None),
+    ('custom_auth:logout', 'POST', None),
+)
+
+
+def warm_urls():
+    from django.urls import get_resolver, resolve, reverse
+
+    resolver = get_resolver()
+    resolver._populate()
+    for name, _, _ in SYNTHETIC_REQUESTS:
+        resolve(reverse(name))
+
+
+def warm_drf():
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.settings import api_settings
+
+    for setting in ('DEFAULT_RENDERER_CLASSES', 'DEFAULT_PARSER_CLASSES',
+                    'DEFAULT_AUTHENTICATION_CLASSES', 'DEFAULT_PERMISSION_CLASSES',
+                    'DEFAULT_THROTTLE_CLASSES', 'DEFAULT_CONTENT_NEGOTIATION_CLASS',
+                    'EXCEPTION_HANDLER'):
+        getattr(api_settings, setting)
+    for renderer_class in api_settings.DEFAULT_RENDERER_CLASSES:
+        renderer_class()
+    JSONRenderer().render({'detail': 'warm-up'})
+
+
+def warm_simplejwt():
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.settings import api_settings
+
+    from custom_auth.tokens import compact_token_backend
+
+    JWTAuthentication()
+    api_settings.AUTH_TOKEN_CLASSES
+    # Первая подпись и проверка инициализируют алгоритмы PyJWT
+    token = compact_token_backend.encode({api_settings.TOKEN_TYPE_CLAIM: 'warm-up', 'exp': time.time() + 60})
+    compact_token_backend.decode(token)
+
+
+def warm_password_validators():
+    from django.contrib.auth.hashers import get_hasher, get_hashers
+    from django.contrib.auth.password_validation import get_default_password_validators
+
+    # CommonPasswordValidator читает словарь из gzip в __init__, список кэшируется
+    get_default_password_validators()
+    get_hashers()
+    get_hasher('default')
+
+
+def warm_silk():
+    if 'silk' not in settings.INSTALLED_APPS:
+        return
+    import silk.collector  # noqa: F401
+    import silk.middleware  # noqa: F401
+    import silk.models  # noqa: F401
+    import silk.sql  # noqa: F401
+
+
+def warm_database():
+    from django.db import connections
+
+    # Соединение переживает первый запрос только при CONN_MAX_AGE > 0; при 0 шаг
+    # всё равно загружает драйвер и версию сервера, которые кэшируются backend-ом
+    for connection in connections.all():
+        connection.ensure_connection()
+
+
+def warm_availability():
+    from custom_auth.availability import index
+
+    # Фильтр свой у каждого воркера: загружается потоковым проходом по пользователям
+    index.load()
+
+
+def warm_requests():
+    from django.urls import reverse
+
+    from sr_auth_api.wsgi import application
+
+    request_logger = logging.getLogger('django.request')
+    level = request_logger.level
+    # Ответы 4xx ожидаемы — не засоряем ими лог
+    request_logger.setLevel(logging.ERROR)
+    try:
+        for name, method, body in SYNTHETIC_REQUESTS:
+            payload = json.dumps(body).encode() if body is not None else b''
+            environ = {
+                'REQUEST_METHOD': method,
+                'PATH_INFO': reverse(name),
+                'CONTENT_TYPE': 'application/json',
+                'CONTENT_LENGTH': str(len(payload)),
+                'wsgi.input': io.BytesIO(payload),
+            }
+            wsgiref.util.setup_testing_defaults(environ)
+            result = application(environ, lambda status, headers, exc_info=None: None)
+            try:
+                for _ in result:
+                    pass
+            finally:
+                result.close()
+    finally:
+        request_logger.setLevel(level)
+
+
+STEPS = {
+    'urls': warm_urls,
+    'drf': warm_drf,
+    'simplejwt': warm_simplejwt,
+    'password_validators': warm_password_validators,
+    'silk': warm_silk,
+    'database': warm_database,
+    'availability': warm_availability,
+    # Последним: см. configured_steps
+    'requests': warm_requests,
+}
+PROCESS_STEPS = ('urls', 'drf', 'simplejwt', 'password_validators', 'silk', 'requests')
+WORKER_STEPS = ('database', 'availability')
+
+
+def configured_steps(candidates):
+    """
+    Отбирает из `candidates` шаги, включённые в настройках.
+
+    Шаги возвращаются в порядке `STEPS`: синтетические запросы идут последними,
+    потому что ``request_finished`` закрывает соединение с БД, нужное шагам воркера.
+
+    :param candidates: Имена шагов.
+    :type candidates: Iterable[str]
+    :return: Шаги в порядке `STEPS`.
+    :rtype: list[str]
+    """
+    if not getattr(settings, 'WARMUP_ENABLED', True):
+        return []
+    enabled = set(getattr(settings, 'WARMUP_STEPS', None) or STEPS)
+    if not getattr(settings, 'WARMUP_REQUESTS', True):
+        enabled.discard('requests')
+    candidates = set(candidates)
+    return [name for name in STEPS if name in candidates and name in enabled]
+
+
+def warm_up(steps):
+    """
+    Выполняет шаги прогрева и логирует длительность каждого.
+
+    Ошибка шага логируется и не прерывает остальные: прогрев не должен мешать
+    воркеру стартовать.
+
+    :param steps: Имена шагов из `STEPS`.
+    :type steps: Iterable[str]
+    :return: ``{шаг: длительность в мс}``.
+    :rtype: dict
+    """
+    timings = {}
+    started = time.perf_counter()
+    for name in steps:
+        step_started = time.perf_counter()
+        try:
+            STEPS[name]()
+        except Exception:
+            logger.exception('Warm-up step %s failed', name, extra={'step': name})
+        timings[name] = round((time.perf_counter() - step_started) * 1000, 3)
+        logger.info('Warm-up step %s took %.1fms', name, timings[name],
+                    extra={'step': name, 'duration_ms': timings[name]})
+    if timings:
+        total_ms = round((time.perf_counter() - started) * 1000, 3)
+        logger.info('Warm-up finished in %.1fms', total_ms, extra={'duration_ms': total_ms, 'steps': timings})
+    return timings